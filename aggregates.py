@@ -0,0 +1,80 @@
+from collections import Counter
+
+from schema import CENTS
+
+
+def _counts(data, column):
+    if column not in data.columns:
+        return Counter()
+    # Em coluna categórica a contagem sai dos códigos; "+" tira as
+    # categorias sem nenhuma linha
+    return +Counter(data[column].value_counts().to_dict())
+
+
+def _total(data, column):
+    # Soma exata em centavos
+    return int(data[column].sum()) if column in data.columns else 0
+
+
+class Aggregates:
+    # Indicadores do Dashboard. Montado uma vez por versão dos dados e depois
+    # atualizado só com as linhas que entraram/saíram em cada gravação.
+    # Valores guardados em centavos (inteiros): somar e subtrair deltas não
+    # acumula erro de ponto flutuante; R$ só na saída.
+
+    def __init__(self, total=0, status=None, artigo=None, pago_cents=0, saldo_cents=0):
+        self.total = total
+        self.status = status or Counter()
+        self.artigo = artigo or Counter()
+        self.pago_cents = pago_cents
+        self.saldo_cents = saldo_cents
+
+    @classmethod
+    def build(cls, data):
+        return cls(
+            total=len(data),
+            status=_counts(data, 'STATUS'),
+            artigo=_counts(data, 'ARTIGO'),
+            pago_cents=_total(data, 'VALOR_PAGO'),
+            saldo_cents=_total(data, 'SALDO_DEVEDOR'),
+        )
+
+    def updated(self, removed, added):
+        # Nova instância: sessões ainda na versão anterior continuam lendo esta
+        old, new = Aggregates.build(removed), Aggregates.build(added)
+        status = self.status.copy()
+        status.subtract(old.status)
+        status.update(new.status)
+        artigo = self.artigo.copy()
+        artigo.subtract(old.artigo)
+        artigo.update(new.artigo)
+        return Aggregates(
+            total=self.total - old.total + new.total,
+            status=+status,  # "+" descarta as contagens zeradas
+            artigo=+artigo,
+            pago_cents=self.pago_cents - old.pago_cents + new.pago_cents,
+            saldo_cents=self.saldo_cents - old.saldo_cents + new.saldo_cents,
+        )
+
+    @property
+    def valor_pago(self):
+        return self.pago_cents / CENTS
+
+    @property
+    def saldo_devedor(self):
+        return self.saldo_cents / CENTS
+
+    @property
+    def concluidos(self):
+        # Conta pelas categorias, sem varrer as linhas
+        return sum(n for s, n in self.status.items() if 'CONCLUÍDO' in str(s).upper())
+
+    def as_dict(self):
+        return {
+            "total": self.total,
+            "concluidos": self.concluidos,
+            "valor_pago": self.valor_pago,
+            "saldo_devedor": self.saldo_devedor,
+            "status": dict(self.status),
+            "artigo": dict(self.artigo),
+        }
@@ -0,0 +1,243 @@
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from aggregates import Aggregates
+from data_cache import SheetCache, _append_change
+from fake_gsheets import FakeConnection, synthetic_sheet
+from grid import RecordGrid
+from indexes import RecordIndex
+from schema import normalize
+from storage import SheetsStorage
+
+# Mede como cada versão do app escala com o tamanho da aba, sem rede: o
+# st.connection("gsheets") é trocado pelo FakeConnection com dados sintéticos.
+#
+#   python benchmark.py --rows 1000 10000 100000 --latency 0.2
+#   python benchmark.py --apps streamlit_app.py --memory --json resultado.json
+#   python benchmark.py --imports --rows   (só o tempo de import dos módulos)
+#   python benchmark.py --rows 10000 --title-rows "CONTROLE DE PROCESSOS"
+
+CONN = None  # conexão falsa usada pelo app durante a medição
+
+# Módulos medidos no --imports: dependências e os módulos do próprio app
+IMPORTS = [
+    "streamlit", "pandas", "plotly.express", "gspread", "streamlit_gsheets",
+    "schema", "storage", "data_cache", "indexes", "grid", "importer", "exporter", "aggregates", "perf",
+    "warmup",
+]
+
+# Executado no lugar do app: troca a conexão e roda o arquivo original
+_SCRIPT = """
+import streamlit as st
+import benchmark
+st.connection = lambda *args, **kwargs: benchmark.CONN
+__file__ = {path!r}
+exec(compile(open({path!r}, encoding="utf-8").read(), {path!r}, "exec"))
+"""
+
+
+class Probe:
+    # Mede tempo, chamadas ao backend falso e (opcional) pico de memória
+    def __init__(self, memory):
+        self.memory = memory
+        self.results = []
+
+    def measure(self, label, fn, **extra):
+        calls = CONN.spreadsheet.total_calls() if CONN is not None else 0
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        error = None
+        try:
+            fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - start
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        result = {
+            "operacao": label, "segundos": round(elapsed, 4),
+            "chamadas": (CONN.spreadsheet.total_calls() - calls) if CONN is not None else 0,
+            "pico_mb": None if peak is None else round(peak / 2**20, 1),
+            "erro": error, **extra,
+        }
+        self.results.append(result)
+        return result
+
+
+def _check(at):
+    # Exceções do script aparecem na árvore, não sobem para quem chamou
+    if at.exception:
+        raise RuntimeError(at.exception[0].message.splitlines()[0][:200])
+
+
+def _menu(at, prefix):
+    radio = at.sidebar.radio[0]
+    radio.set_value(next(o for o in radio.options if o.startswith(prefix))).run()
+    _check(at)
+
+
+def _save_new(at):
+    name = next(t for t in at.text_input if "Requerente" in t.label)
+    name.input("Benchmark da Silva")
+    next(b for b in at.button if b.label.startswith(("Salvar", "✅"))).click().run()
+    _check(at)
+
+
+def _search(at, text):
+    # Versão atual: a lista só tem os resultados da busca
+    box = next((t for t in at.text_input if t.label == "Pesquisar"), None)
+    if box is not None:
+        box.input(text).run()
+        _check(at)
+
+
+def _pick_record(at, record_id, name):
+    picker = next(s for s in at.selectbox if s.label.startswith(("Selecione", "Pesquisar")))
+    if isinstance(picker.value, str):
+        # Versões antigas escolhem pelo nome
+        picker.select_index(min(1, len(picker.options) - 1)).run()
+    else:
+        # Versão atual escolhe pelo ID (o rótulo vem do format_func)
+        _search(at, name)
+        picker = next(s for s in at.selectbox if s.label.startswith("Selecione"))
+        picker.set_value(record_id).run()
+    _check(at)
+
+
+def bench_app(path, data, args, probe):
+    # Cada etapa é um rerun completo do app, como o usuário veria
+    global CONN
+    CONN = FakeConnection(data, latency=args.latency, title_rows=args.title_rows)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    at = AppTest.from_string(_SCRIPT.format(path=path), default_timeout=args.timeout)
+    extra = {"app": path, "linhas": len(data)}
+    last = data.iloc[-1]
+
+    def first_run():
+        at.run()
+        _check(at)
+
+    steps = [
+        ("carga + Dashboard (fria)", first_run),
+        ("Dashboard (rerun)", lambda: (at.run(), _check(at))),
+        ("abrir Inclusão", lambda: _menu(at, "➕")),
+        ("salvar inclusão", lambda: _save_new(at)),
+        ("abrir Gerenciar", lambda: _menu(at, "📝")),
+        ("selecionar registro", lambda: _pick_record(at, int(last["ID"]), last["Requerente"])),
+    ]
+    for label, fn in steps:
+        if probe.measure(label, fn, **extra)["erro"]:
+            break  # a sessão ficou num estado que as próximas etapas não usam
+
+
+def _grid_page(data):
+    # Primeira página filtrada e ordenada, com a montagem das máscaras
+    grid = RecordGrid.build(data)
+    rows = grid.rows({"STATUS": grid.values("STATUS")[:1]}, saldo=True)
+    return grid.page(rows, 1, 50)
+
+
+def bench_core(data, args, probe):
+    # As mesmas operações sem renderizar, direto nas camadas do app atual
+    global CONN
+    CONN = FakeConnection(data, latency=args.latency, title_rows=args.title_rows)
+    storage = SheetsStorage(CONN)
+    cache = SheetCache()
+    extra = {"app": "núcleo", "linhas": len(data)}
+    state = {}
+
+    def patch():
+        record = {"ID": 10**9, "REQUERENTE": "Benchmark da Silva", "STATUS": "SUBMETIDO", "VALOR_PAGO": 0}
+        state["data"] = _append_change(record)(state["data"], normalize)[0]
+
+    steps = [
+        ("ler aba", lambda: state.update(raw=storage.read())),
+        ("normalizar", lambda: state.update(data=normalize(state["raw"].copy()))),
+        ("agregados (completo)", lambda: Aggregates.build(state["data"])),
+        ("índice Gerenciar", lambda: state.update(index=RecordIndex.build(state["data"]))),
+        ("busca por ID", lambda: state["index"].row(state["data"], state["index"].choices[-1])),
+        ("grade Registros", lambda: _grid_page(state["data"])),
+        ("inclusão no cache (delta)", patch),
+        ("cache: conferir revisão", lambda: (cache.get(storage, normalize), cache.get(storage, normalize))),
+    ]
+    for label, fn in steps:
+        probe.measure(label, fn, **extra)
+
+
+def bench_imports(probe):
+    # Cada import num processo novo (cold start), com -X importtime: o tempo
+    # acumulado inclui os módulos que ele puxa
+    for module in IMPORTS:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True,
+        )
+        match = re.search(rf"\|\s*(\d+)\s*\|\s*{re.escape(module)}\s*$", proc.stderr, re.MULTILINE)
+        probe.results.append({
+            "operacao": f"import {module}", "app": "imports", "linhas": 0,
+            "segundos": round(int(match.group(1)) / 1e6, 4) if match else 0.0,
+            "chamadas": 0, "pico_mb": None,
+            "erro": None if proc.returncode == 0 else proc.stderr.strip().splitlines()[-1],
+        })
+
+
+def report(results):
+    header = f"{'app':<22} {'linhas':>7}  {'operação':<28} {'seg':>8} {'cham.':>6} {'pico MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        peak = "" if r["pico_mb"] is None else f"{r['pico_mb']:.1f}"
+        line = f"{r['app']:<22} {r['linhas']:>7}  {r['operacao']:<28} {r['segundos']:>8.3f} {r['chamadas']:>6} {peak:>8}"
+        print(line + (f"  ERRO {r['erro']}" if r["erro"] else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do app com planilha falsa em memória")
+    parser.add_argument("--rows", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument("--apps", nargs="+", default=sorted(glob.glob("streamlit_app*.py")))
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos por chamada à API falsa")
+    parser.add_argument("--title-rows", nargs="*", default=[], metavar="TITULO",
+                        help="linhas de título acima do cabeçalho, como em algumas cópias da planilha")
+    parser.add_argument("--memory", action="store_true", help="mede o pico de memória (mais lento)")
+    parser.add_argument("--no-core", action="store_true", help="não mede as operações isoladas")
+    parser.add_argument("--imports", action="store_true", help="mede o tempo de import de cada módulo")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+    # O script do app importa "benchmark" para achar a CONN: mesmo módulo
+    sys.modules.setdefault("benchmark", sys.modules[__name__])
+    # Mede a leitura a frio: sem cópia local de execuções anteriores
+    os.environ.setdefault("NACIONALIDADE_SNAPSHOT", "false")
+
+    probe = Probe(args.memory)
+    if args.imports:
+        bench_imports(probe)
+    for rows in args.rows:
+        data = synthetic_sheet(rows, seed=args.seed)
+        if not args.no_core:
+            bench_core(data, args, probe)
+        for path in args.apps:
+            bench_app(path, data, args, probe)
+    report(probe.results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(probe.results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+import contextlib
+import logging
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from schema import WORKSHEET, concat, new_rows, set_values
+from perf import span
+from sheets_client import ThrottledError
+from storage import ConflictError, _enabled, setting, sheets_storage
+
+logger = logging.getLogger(__name__)
+# Backends sem marcador de revisão (planilha pública): relê no máximo a cada N segundos
+FALLBACK_TTL = 30
+_UNKNOWN = object()  # revisão que não deu para conferir
+
+
+class Dataset:
+    # Uma versão imutável dos dados. Cada gravação gera uma versão nova; os
+    # valores derivados (agregados, índices) ficam presos à versão que os gerou.
+
+    def __init__(self, data, revision, version, normalize=None):
+        self.data = data
+        self.revision = revision
+        self.version = version
+        self.normalize = normalize
+        self.read_at = time.monotonic()
+        self._derived = {}
+
+    def derived(self, name, build):
+        if name not in self._derived:
+            self._derived[name] = build(self.data)
+        return self._derived[name]
+
+    def evolve(self, data, revision, version, removed, added):
+        # Próxima versão após uma gravação. Derivados que sabem se atualizar
+        # por delta (método updated) são levados adiante; os demais são refeitos.
+        nxt = Dataset(data, revision, version, self.normalize)
+        for name, value in self._derived.items():
+            if hasattr(value, "updated"):
+                nxt._derived[name] = value.updated(removed, added)
+        return nxt
+
+
+class SheetCache:
+    # Cache único por processo, compartilhado por todas as sessões.
+    # Guarda o DataFrame já normalizado e só lê o backend de novo quando
+    # a revisão (modifiedTime do Drive, contador do SQLite) muda.
+
+    def __init__(self, snapshots=None):
+        self._lock = threading.Lock()
+        self.snapshots = snapshots  # cópia local em Parquet (snapshot.Snapshots)
+        self._entries = {}  # (backend, normalização, projeção) -> Dataset
+        self._versions = {}  # backend -> última versão emitida
+        self._writes = {}  # backend -> gravações aplicadas (patch/flushed)
+        self._loading = {}  # entrada -> lock de quem a está lendo
+        self.reads = 0
+        self.probes = 0
+        self.patches = 0
+        self.stale = 0  # respostas com dados antigos por falta de cota
+
+    def _next_version(self, storage_name):
+        self._versions[storage_name] = self._versions.get(storage_name, 0) + 1
+        return self._versions[storage_name]
+
+    def get(self, storage, normalize=None, columns=None):
+        # columns: só estas colunas (projeção); cada projeção é uma entrada
+        columns = columns and tuple(columns)
+        key = (storage.name, normalize and f"{normalize.__module__}.{normalize.__qualname__}", columns)
+        # Uma leitura por entrada de cada vez. O lock geral só guarda os
+        # dicionários: nenhuma chamada ao backend acontece com ele preso.
+        with self._loader(key):
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None and self.snapshots is not None:
+                entry = self._from_snapshot(storage, normalize, key)
+                if entry is not None:
+                    # Serve a cópia local já; a conferência com o backend
+                    # (e a releitura, se mudou) acontece em segundo plano
+                    threading.Thread(
+                        target=self._reconcile, args=(storage, normalize, columns), name="reconcile", daemon=True,
+                    ).start()
+                    return entry
+            try:
+                with span("revision"), _calls(storage, entry):
+                    revision = storage.revision()
+            except ThrottledError:
+                # Sem cota para conferir: serve a cópia que tiver, mesmo antiga
+                if entry is None:
+                    raise
+                return self._stale(entry)
+            with self._lock:
+                self.probes += 1
+                writes = self._writes.get(storage.name, 0)
+            if entry is not None:
+                if revision is not None and revision == entry.revision:
+                    return entry
+                if revision is None and time.monotonic() - entry.read_at < FALLBACK_TTL:
+                    return entry
+
+            # Revisão nova (ou primeira leitura): lê a aba (ou as colunas pedidas)
+            try:
+                with span("read"), _calls(storage, entry):
+                    data = storage.read(columns and list(columns))
+            except ThrottledError:
+                if entry is None:
+                    raise
+                return self._stale(entry)
+            if normalize is not None:
+                with span("normalize"):
+                    data = _replay(normalize(data, columns and list(columns)), normalize, storage.pending())
+            self._register(storage)
+            with self._lock:
+                self.reads += 1
+                if self._writes.get(storage.name, 0) != writes:
+                    # Houve gravação durante a leitura: ela pode não estar
+                    # aqui, então a próxima consulta relê
+                    revision = _UNKNOWN
+                entry = Dataset(data, revision, self._next_version(storage.name), normalize)
+                self._entries[key] = entry
+                if revision is not _UNKNOWN:
+                    self._save(key, entry)
+            return entry
+
+    def _loader(self, key):
+        with self._lock:
+            return self._loading.setdefault(key, threading.Lock())
+
+    def _stale(self, entry):
+        with self._lock:
+            self.stale += 1
+        return entry
+
+    def _from_snapshot(self, storage, normalize, key):
+        loaded = self.snapshots.load(key)
+        if loaded is None:
+            return None
+        data, revision = loaded
+        if normalize is not None:
+            # Gravações do write-behind que ainda não chegaram ao backend
+            data = _replay(data, normalize, storage.pending())
+        self._register(storage)
+        with self._lock:
+            entry = Dataset(data, revision, self._next_version(storage.name), normalize)
+            if revision is None:
+                # Sem revisão não há como validar a cópia: a próxima consulta relê
+                entry.read_at = float("-inf")
+            self._entries[key] = entry
+        return entry
+
+    def _register(self, storage):
+        # Write-behind: avisos de lote enviado e consulta da VERSAO em memória
+        if getattr(storage, "on_flush", False) is None:
+            storage.on_flush = self.flushed
+            storage.known_version = self.known_version
+
+    def known_version(self, storage, record_id):
+        # VERSAO do registro na memória (None se não está carregado)
+        with self._lock:
+            for key, entry in self._entries.items():
+                if key[0] != storage.name or 'VERSAO' not in entry.data.columns:
+                    continue
+                rows = entry.data.loc[_id_mask(entry.data, record_id), 'VERSAO']
+                if len(rows):
+                    return None if pd.isna(rows.iloc[0]) else int(rows.iloc[0])
+        return None
+
+    def _reconcile(self, storage, normalize, columns):
+        try:
+            self.get(storage, normalize, columns)
+        except Exception:
+            logger.exception("Falha ao conferir a cópia local com %s", storage.name)
+
+    def _save(self, key, entry):
+        if self.snapshots is not None:
+            self.snapshots.schedule(key, entry)
+
+    def patch(self, storage, change, before):
+        # Aplica uma gravação já feita no backend às versões em memória, sem
+        # reler. change(data, normalize) devolve (novo DataFrame, linhas que
+        # saíram, linhas que entraram). before: revisão lida antes da
+        # gravação. Se ela já não era a da memória, alguém gravou nesse meio
+        # tempo (outra réplica, edição direta na planilha) e a alteração dele
+        # não está aqui: a entrada é descartada e relida. Fica aberta só a
+        # janela entre as duas conferências (antes e depois da gravação): o
+        # que outro gravar nela passa como visto até a próxima mudança.
+        after = _revision(storage)
+        with self._lock:
+            self._writes[storage.name] = self._writes.get(storage.name, 0) + 1
+            version = self._next_version(storage.name)
+            for key in [k for k in self._entries if k[0] == storage.name]:
+                entry = self._entries[key]
+                # Sem normalização (apps antigos) não há como aplicar a linha
+                if entry.normalize is None or after is _UNKNOWN or entry.revision != before:
+                    del self._entries[key]
+                    continue
+                data, removed, added = change(entry.data, entry.normalize)
+                self._entries[key] = entry.evolve(data, after, version, removed, added)
+                self._save(key, self._entries[key])
+            self.patches += 1
+
+    def flushed(self, storage, ok, before):
+        # Lote do write-behind gravado: a memória já tinha essas alterações,
+        # então basta adotar a nova revisão, com a mesma conferência de
+        # patch (before: revisão antes do envio). Se algo foi recusado, relê.
+        if not ok:
+            self.invalidate(storage.name)
+            return
+        after = _revision(storage)
+        with self._lock:
+            self._writes[storage.name] = self._writes.get(storage.name, 0) + 1
+            for key in [k for k in self._entries if k[0] == storage.name]:
+                entry = self._entries[key]
+                if after is _UNKNOWN or entry.revision != before:
+                    del self._entries[key]
+                    continue
+                entry.revision = after
+                self._save(key, entry)
+
+    def invalidate(self, storage_name):
+        with self._lock:
+            self._writes[storage_name] = self._writes.get(storage_name, 0) + 1
+            for key in [k for k in self._entries if k[0] == storage_name]:
+                del self._entries[key]
+
+
+@st.cache_resource
+def shared_cache():
+    # snapshot = false desliga a cópia local (pasta em snapshot_dir)
+    snapshots = None
+    if _enabled(setting("snapshot", True)):
+        from snapshot import Snapshots
+
+        snapshots = Snapshots(setting("snapshot_dir", "snapshots"))
+    return SheetCache(snapshots)
+
+
+def dataset(storage, normalize=None, columns=None):
+    return shared_cache().get(storage, normalize, columns)
+
+
+def load(storage, normalize=None):
+    # O DataFrame é compartilhado entre as sessões: não deve ser alterado
+    return dataset(storage, normalize).data
+
+
+def _calls(storage, entry):
+    # Com uma cópia para servir, o backend é consultado sem novas tentativas
+    # nem espera por cota: sem resposta na hora, vale a cópia
+    return storage.no_wait() if entry is not None else contextlib.nullcontext()
+
+
+def _revision(storage):
+    # Revisão do backend em volta de uma gravação (ver SheetCache.patch),
+    # sem esperar. Sem cota para conferir, a cópia em memória é descartada
+    try:
+        with storage.no_wait():
+            return storage.revision()
+    except ThrottledError:
+        return _UNKNOWN
+
+
+def _id_mask(data, record_id):
+    # ID é inteiro anulável: linha sem ID nunca casa (nem na negação)
+    return data['ID'].eq(record_id).fillna(False).astype(bool)
+
+
+def _append_change(record):
+    def change(data, normalize):
+        if 'ID' in data.columns and _id_mask(data, record.get('ID')).any():
+            # Já está nos dados (pendência reaplicada depois de gravada)
+            return data, data.iloc[:0], data.iloc[:0]
+        # O backend grava a linha nova com VERSAO 1
+        row = new_rows([{'VERSAO': 1, **record}], data.columns)
+        row = row.dropna(subset=['REQUERENTE'])
+        return concat(data, row), data.iloc[:0], row
+    return change
+
+
+def _appends_change(records):
+    def change(data, normalize):
+        if 'ID' in data.columns:
+            # Pendências reaplicadas depois de gravadas já estão nos dados
+            ids = data['ID']
+            present = set(ids[ids.isin([r.get('ID') for r in records]).fillna(False).astype(bool)].astype(int))
+            records_ = [r for r in records if r.get('ID') not in present]
+        else:
+            records_ = records
+        rows = new_rows([{'VERSAO': 1, **r} for r in records_], data.columns)
+        rows = rows.dropna(subset=['REQUERENTE'])
+        return concat(data, rows), data.iloc[:0], rows
+    return change
+
+
+def _update_change(record_id, fields):
+    def change(data, normalize):
+        mask = _id_mask(data, record_id)
+        before = data[mask]
+        data = set_values(data.copy(), mask, fields)
+        return data, before, data[mask]
+    return change
+
+
+def _updates_change(ops):
+    def change(data, normalize):
+        touched = data['ID'].isin([op['id'] for op in ops]).fillna(False).astype(bool)
+        before = data[touched]
+        data = data.copy()
+        for op in ops:
+            data = set_values(data, _id_mask(data, op['id']), op['fields'])
+        return data, before, data[touched]
+    return change
+
+
+def _delete_change(record_id):
+    def change(data, normalize):
+        mask = _id_mask(data, record_id)
+        return data[~mask], data[mask], data.iloc[:0]
+    return change
+
+
+def _replay(data, normalize, ops):
+    # Reaplica sobre uma leitura nova as gravações que o backend ainda não
+    # recebeu (modo write-behind)
+    for op in ops:
+        if op['op'] == 'append':
+            change = _append_change(op['record'])
+        elif op['op'] == 'update':
+            # Mesma VERSAO que update_row deixa na memória
+            fields = op['fields']
+            if op.get('expected_version') is not None:
+                fields = {**fields, 'VERSAO': int(op['expected_version']) + 1}
+            change = _update_change(op['id'], fields)
+        else:
+            change = _delete_change(op['id'])
+        data = change(data, normalize)[0]
+    return data
+
+
+def append_row(storage, record):
+    before = _revision(storage)
+    with span("write"):
+        storage.append_row(record)
+    shared_cache().patch(storage, _append_change(record), before)
+
+
+def append_rows(storage, records):
+    # Várias linhas novas num só lote (importação)
+    before = _revision(storage)
+    with span("write"):
+        failures = storage.apply_batch([{'op': 'append', 'record': r} for r in records])
+    if failures:
+        invalidate(storage)
+        return failures
+    shared_cache().patch(storage, _appends_change(records), before)
+    return failures
+
+
+def update_row(storage, record_id, fields, expected_version=None):
+    before = _revision(storage)
+    try:
+        with span("write"):
+            version = storage.update_row(record_id, fields, expected_version)
+    except ConflictError:
+        # A cópia em memória está desatualizada: descarta
+        invalidate(storage)
+        raise
+    if version is not None:
+        fields = {**fields, 'VERSAO': version}
+    shared_cache().patch(storage, _update_change(record_id, fields), before)
+
+
+def update_rows(storage, ops):
+    # Várias alterações ({'op': 'update', ...}) num só lote. Devolve
+    # [(posição, erro)] das recusadas; havendo alguma, a cópia em memória
+    # é descartada, como no conflito de update_row.
+    before = _revision(storage)
+    with span("write"):
+        failures = storage.apply_batch(ops)
+    if failures:
+        invalidate(storage)
+        return failures
+    # A versão gravada é a conferida mais um (ver update_row dos backends)
+    ops = [
+        {**op, 'fields': {**op['fields'], 'VERSAO': op['expected_version'] + 1}}
+        if op.get('expected_version') is not None else op
+        for op in ops
+    ]
+    shared_cache().patch(storage, _updates_change(ops), before)
+    return failures
+
+
+def delete_row(storage, record_id, expected_version=None):
+    before = _revision(storage)
+    try:
+        with span("write"):
+            storage.delete_row(record_id, expected_version)
+    except ConflictError:
+        invalidate(storage)
+        raise
+    shared_cache().patch(storage, _delete_change(record_id), before)
+
+
+def invalidate(storage):
+    # Força a próxima leitura a buscar os dados de novo
+    shared_cache().invalidate(storage.name)
+
+
+def read_sheet(conn, worksheet=WORKSHEET, normalize=None):
+    # Usado pelas versões antigas do app, que alteram o DataFrame: devolve cópia
+    return load(sheets_storage(conn, worksheet), normalize).copy()
+
+
+def invalidate_sheet(worksheet=WORKSHEET):
+    shared_cache().invalidate(f"gsheets:{worksheet}")
@@ -0,0 +1,165 @@
+import argparse
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from grid import display
+from schema import DATE_COLUMNS, DATE_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# Exportação da página Registros (e do terminal): o arquivo é escrito aos
+# blocos a partir do DataFrame em cache com todas as colunas (a página usa
+# uma projeção sem Observações), direto em disco, sem reler a planilha a
+# cada download nem montar o arquivo inteiro na memória. Cada arquivo fica
+# guardado pela versão dos dados + filtro: baixar de novo o mesmo relatório
+# não gera nada.
+#
+#   python exporter.py relatorio.xlsx
+
+FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+CHUNK_ROWS = 5000
+KEEP = 8  # arquivos guardados por processo
+
+
+def export_data(data):
+    # Colunas do arquivo, na tela e no terminal: as do cadastro; a VERSAO é
+    # controle interno e fica de fora
+    return data.drop(columns=['VERSAO'], errors='ignore')
+
+
+def full_rows(full, data, rows):
+    # rows: posições em data (projeção da página) -> posições em full (todas
+    # as colunas). As duas entradas do cache costumam ter as mesmas linhas;
+    # se uma delas já foi relida e a outra não, casa pelo ID
+    if full['ID'].equals(data['ID']):
+        return rows
+    ids = full['ID']
+    pos = pd.Series(np.arange(len(full)), index=ids.to_numpy())[(~ids.duplicated() & ids.notna()).to_numpy()]
+    return pos.reindex(data['ID'].iloc[rows].to_numpy()).dropna().astype(int).to_numpy()
+
+
+def _chunks(data, rows):
+    # Blocos da exportação no formato de exibição da tabela (R$, texto)
+    for start in range(0, len(rows), CHUNK_ROWS):
+        yield display(data.iloc[rows[start:start + CHUNK_ROWS]])
+
+
+def write_csv(data, rows, path):
+    # Mesmo formato que a importação lê (datas dd/mm/aaaa, ponto decimal)
+    with open(path, "w", encoding="utf-8-sig", newline="") as fh:
+        for i, chunk in enumerate(_chunks(data, rows)):
+            chunk.to_csv(fh, header=i == 0, index=False, date_format=DATE_FORMAT)
+        if not len(rows):
+            fh.write(",".join(data.columns) + "\n")
+
+
+def write_xlsx(data, rows, path):
+    # openpyxl em modo write_only: cada linha vai para o arquivo ao ser
+    # acrescentada. Só quem exporta XLSX precisa do openpyxl
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("NACIONALIDADE")
+    sheet.append(list(data.columns))
+    for chunk in _chunks(data, rows):
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for col in DATE_COLUMNS:
+            if col in values.columns:
+                values[col] = [None if v is None else v.to_pydatetime() for v in values[col]]
+        for row in values.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+
+
+def write_parquet(data, rows, path):
+    writer = None
+    try:
+        for chunk in _chunks(data, rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            pq.write_table(pa.Table.from_pandas(data.iloc[:0], preserve_index=False), path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx, "parquet": write_parquet}
+
+
+class Exports:
+    # Arquivos já gerados, por chave (backend, versão dos dados, formato,
+    # filtro). Os mais antigos saem quando passam de KEEP.
+
+    def __init__(self, directory=None, keep=KEEP):
+        self.directory = directory or tempfile.mkdtemp(prefix="exportacoes-")
+        os.makedirs(self.directory, exist_ok=True)
+        self.keep = keep
+        self.generated = 0
+        self._files = OrderedDict()  # chave -> caminho
+        self._lock = threading.Lock()
+
+    def path(self, key, fmt, data, rows):
+        # Caminho do arquivo desta chave; gera só na primeira vez
+        with self._lock:
+            path = self._files.get(key)
+            if path is not None and os.path.exists(path):
+                self._files.move_to_end(key)
+                return path
+            path = os.path.join(self.directory, f"{self.generated}.{fmt}")
+            tmp = f"{path}.tmp"
+            WRITERS[fmt](data, rows, tmp)
+            os.replace(tmp, path)
+            self.generated += 1
+            self._files[key] = path
+            while len(self._files) > self.keep:
+                _, old = self._files.popitem(last=False)
+                try:
+                    os.remove(old)
+                except OSError:
+                    logger.warning("Não foi possível apagar a exportação antiga %s", old)
+            return path
+
+
+@st.cache_resource
+def shared_exports():
+    # Uma pasta por processo (export_dir na configuração, ou temporária)
+    from storage import setting
+
+    return Exports(setting("export_dir", None))
+
+
+def main():
+    from data_cache import dataset
+    from schema import normalize
+    from storage import get_storage
+
+    parser = argparse.ArgumentParser(description="Exporta a aba NACIONALIDADE")
+    parser.add_argument("arquivo", help="destino; o formato vem da extensão (.csv, .xlsx, .parquet)")
+    args = parser.parse_args()
+    fmt = os.path.splitext(args.arquivo)[1].lstrip(".").lower()
+    if fmt not in WRITERS:
+        parser.error(f"formato desconhecido: {fmt!r} (use {', '.join(WRITERS)})")
+
+    data = export_data(dataset(get_storage(), normalize).data)
+    WRITERS[fmt](data, np.arange(len(data)), args.arquivo)
+    print(f"{len(data)} registro(s) em {args.arquivo}")
+
+
+if __name__ == "__main__":
+    main()
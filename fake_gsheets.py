@@ -0,0 +1,307 @@
+import csv
+import io
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol
+
+# Substituto local (em memória) do GSheetsConnection, para testar o app e o
+# SheetsStorage sem rede. Imita só as chamadas que o app usa, pode simular
+# a latência da API (latency, em segundos por chamada) e a cota do Google
+# devolvendo 429 (fail_next / quota_per_call), além de erros pontuais por
+# chamada (errors).
+
+# Cabeçalho como está na planilha real (antes da padronização)
+SHEET_HEADER = [
+    'ID', 'Numero do Processo', 'Requerente', 'Cliente', 'E_Mail', 'Aniversário', 'Artigo',
+    'Status', 'Valor Honorários', 'Valor Pago', 'Saldo Devedor', 'Observações', 'Versao',
+]
+
+_FIRST_NAMES = [
+    'José', 'João', 'Antônio', 'Francisco', 'Luís', 'Sérgio', 'Márcia', 'Conceição', 'Ângela',
+    'Inês', 'Lúcia', 'Célia', 'Ana', 'Maria', 'Paulo', 'Joaquim', 'Fátima', 'Tânia', 'Vitória', 'Mônica',
+]
+_LAST_NAMES = [
+    'da Silva', 'Gonçalves', 'Simões', 'Conceição', 'Magalhães', 'Araújo', 'Brandão', 'Romão',
+    'Assunção', 'Fernandes', 'Pereira', 'Guimarães', 'Lourenço', 'Tavares', 'Salgueiro', 'Calçada',
+]
+_ARTIGOS = ['Neto', 'Filho', 'Casamento', 'Outros']
+_STATUS = ['SUBMETIDO', 'EM ANÁLISE', 'DILIGÊNCIA', 'DECISÃO', 'CONCLUÍDO']
+
+
+def synthetic_sheet(rows, seed=0):
+    # Aba NACIONALIDADE fictícia com o cabeçalho real, acentos, homônimos e
+    # células vazias (NaN) nas mesmas colunas em que aparecem na planilha
+    rng = np.random.default_rng(seed)
+    first = rng.choice(_FIRST_NAMES, rows)
+    last = rng.choice(_LAST_NAMES, rows)
+    middle = rng.choice(_LAST_NAMES, rows)
+    names = pd.Series(first) + ' ' + pd.Series(middle) + ' ' + pd.Series(last)
+    honorarios = rng.choice([1500.0, 2500.0, 3000.0, 4500.0], rows)
+    pago = np.round(honorarios * rng.choice([0, 0.25, 0.5, 1.0], rows), 2)
+
+    def blanks(values, share):
+        values = pd.Series(values, dtype=object)
+        values[rng.random(rows) < share] = None
+        return values
+
+    data = pd.DataFrame({
+        'ID': np.arange(1, rows + 1),
+        'Numero do Processo': blanks([f"{y}/{n:06d}" for y, n in zip(rng.integers(2015, 2025, rows), rng.integers(0, 999999, rows))], 0.1),
+        'Requerente': names,
+        'Cliente': blanks(pd.Series(rng.choice(_FIRST_NAMES, rows)) + ' ' + pd.Series(last), 0.2),
+        'E_Mail': blanks([f"requerente{i}@exemplo.com.br" for i in range(rows)], 0.3),
+        'Aniversário': blanks([f"{d:02d}/{m:02d}/{y}" for d, m, y in zip(
+            rng.integers(1, 29, rows), rng.integers(1, 13, rows), rng.integers(1930, 2010, rows))], 0.15),
+        'Artigo': rng.choice(_ARTIGOS, rows, p=[0.5, 0.3, 0.15, 0.05]),
+        'Status': rng.choice(_STATUS, rows, p=[0.2, 0.3, 0.1, 0.1, 0.3]),
+        'Valor Honorários': blanks(honorarios, 0.05),
+        'Valor Pago': blanks(pago, 0.05),
+        'Saldo Devedor': honorarios - pago,
+        'Observações': blanks(rng.choice([
+            'Aguardando certidão de nascimento do avô.',
+            'Documentação apostilada enviada em lote; conferir tradução juramentada.',
+            'Cliente pediu retorno por e-mail.',
+        ], rows), 0.6),
+        'Versao': blanks(np.ones(rows, dtype=int), 0.5),
+    })
+    # Linhas em branco no meio da aba (REQUERENTE vazio)
+    data.loc[rng.random(rows) < 0.01, 'Requerente'] = None
+    return data[SHEET_HEADER]
+
+
+class _Response:
+    # O mínimo que APIError precisa para montar a exceção
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+        self._body = {"error": {"code": status_code, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+
+    def json(self):
+        return self._body
+
+
+class _Cell:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, values, sheet_id):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.values = [[str(v) for v in row] for row in values]
+
+    def _call(self, name):
+        self.spreadsheet._call(name)
+
+    def _touch(self):
+        self.spreadsheet._touch()
+
+    def row_values(self, row, **kwargs):
+        self._call("row_values")
+        if row > len(self.values):
+            return []
+        values = list(self.values[row - 1])
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col, **kwargs):
+        self._call("col_values")
+        values = [r[col - 1] if len(r) >= col else "" for r in self.values]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def acell(self, label):
+        self._call("acell")
+        row, col = a1_to_rowcol(label)
+        row_values = self.values[row - 1] if row <= len(self.values) else []
+        return _Cell(row_values[col - 1] if col <= len(row_values) else None)
+
+    def _get_range(self, a1):
+        grid = a1_range_to_grid_range(a1)
+        rows = self.values[grid["startRowIndex"]:grid.get("endRowIndex", len(self.values))]
+        return [r[grid.get("startColumnIndex", 0):grid.get("endColumnIndex", len(r))] for r in rows]
+
+    def batch_get(self, ranges, major_dimension=None, **kwargs):
+        self._call("batch_get")
+        result = [self._get_range(a1) for a1 in ranges]
+        if major_dimension == "COLUMNS":
+            # Uma lista por coluna, sem as células vazias do fim (como a API)
+            result = [_columns(grid) for grid in result]
+        return result
+
+    def _set(self, row, col, value):
+        while len(self.values) < row:
+            self.values.append([])
+        cells = self.values[row - 1]
+        cells.extend([""] * (col - len(cells)))
+        cells[col - 1] = str(value)
+
+    def update(self, range_name, values, **kwargs):
+        self._call("update")
+        row, col = a1_to_rowcol(range_name.split(":")[0])
+        for i, line in enumerate(values):
+            for j, value in enumerate(line):
+                self._set(row + i, col + j, value)
+        self._touch()
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update")
+        for item in data:
+            row, col = a1_to_rowcol(item["range"].split(":")[0])
+            for i, line in enumerate(item["values"]):
+                for j, value in enumerate(line):
+                    self._set(row + i, col + j, value)
+        self._touch()
+
+    def append_rows(self, rows, **kwargs):
+        self._call("append_rows")
+        first = len(self.values) + 1
+        self.values.extend([[str(v) for v in row] for row in rows])
+        self._touch()
+        last = len(self.values)
+        return {"updates": {"updatedRange": f"{self.title}!A{first}:Z{last}", "updatedRows": len(rows)}}
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        self.values.append([str(v) for v in values])
+        self._touch()
+        row = len(self.values)
+        return {"updates": {"updatedRange": f"{self.title}!A{row}:Z{row}", "updatedRows": 1}}
+
+    def delete_rows(self, start, end=None):
+        self._call("delete_rows")
+        del self.values[start - 1:end or start]
+        self._touch()
+
+    def frame(self):
+        # Como o GSheetsConnection: a primeira linha vira cabeçalho e os tipos
+        # são inferidos como num CSV (números viram float/int, vazio vira NaN)
+        buf = io.StringIO()
+        csv.writer(buf).writerows(self.values)
+        buf.seek(0)
+        return pd.read_csv(buf)
+
+
+def _columns(grid):
+    width = max((len(r) for r in grid), default=0)
+    columns = [[r[c] if c < len(r) else "" for r in grid] for c in range(width)]
+    for values in columns:
+        while values and values[-1] == "":
+            values.pop()
+    return columns
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets):
+        self._lock = threading.Lock()
+        self._sheets = {}
+        self._modified = 0
+        # Como no Drive, planilhas diferentes não repetem a data de alteração
+        self._created = time.time()
+        self.calls = {}
+        self.fail_next = 0  # próximas N chamadas recebem 429
+        self.quota_per_call = None  # ou: função(nome da chamada) -> True para recusar
+        # nome da chamada -> lista com o resultado das próximas chamadas:
+        # None passa, um código (ex.: 503) vira APIError com esse status
+        self.errors = {}
+        self.latency = 0.0
+        for title, values in sheets.items():
+            self._sheets[title] = FakeWorksheet(self, title, values, len(self._sheets))
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            throttled = self.fail_next > 0 or (self.quota_per_call is not None and self.quota_per_call(name))
+            if self.fail_next > 0:
+                self.fail_next -= 1
+            queued = self.errors.get(name)
+            status = queued.pop(0) if queued else None
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            raise APIError(_Response(429, "Quota exceeded for quota metric 'Read requests'"))
+        if status is not None:
+            raise APIError(_Response(status, "The service is currently unavailable."))
+
+    def _touch(self):
+        with self._lock:
+            self._modified += 1
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def get_lastUpdateTime(self):
+        self._call("get_lastUpdateTime")
+        stamp = self._created + self._modified
+        return datetime.fromtimestamp(stamp, timezone.utc).isoformat()
+
+    def worksheet(self, title):
+        self._call("worksheet")
+        if title not in self._sheets:
+            raise WorksheetNotFound(title)
+        return self._sheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self._call("add_worksheet")
+        ws = self._sheets[title] = FakeWorksheet(self, title, [], len(self._sheets))
+        self._touch()
+        return ws
+
+    def batch_update(self, body):
+        self._call("batch_update")
+        by_id = {ws.id: ws for ws in self._sheets.values()}
+        for req in body.get("requests", []):
+            rng = req["deleteDimension"]["range"]
+            del by_id[rng["sheetId"]].values[rng["startIndex"]:rng["endIndex"]]
+        self._touch()
+
+
+class FakeClient:
+    # Mesmos métodos privados do GSheetsServiceAccountClient usados pelo storage
+    def __init__(self, spreadsheet, default_worksheet):
+        self.spreadsheet = spreadsheet
+        self._default = default_worksheet
+
+    def _open_spreadsheet(self):
+        self.spreadsheet._call("open_spreadsheet")
+        return self.spreadsheet
+
+    def _select_worksheet(self, worksheet=None):
+        return self.spreadsheet.worksheet(worksheet or self._default)
+
+
+def _values(data):
+    return [list(data.columns)] + data.astype(object).where(data.notna(), "").values.tolist()
+
+
+class FakeConnection:
+    # title_rows: linhas de título acima do cabeçalho (ex.: "CONTROLE ..."),
+    # como em algumas cópias da planilha
+    def __init__(self, data=None, worksheet="NACIONALIDADE", latency=0.0, title_rows=()):
+        values = [] if data is None else _values(data)
+        # Como uma célula mesclada sobre a largura da tabela
+        width = len(values[0]) if values else 1
+        values = [[title] + [""] * (width - 1) for title in title_rows] + values
+        self.spreadsheet = FakeSpreadsheet({worksheet: values})
+        self.spreadsheet.latency = latency
+        self.client = FakeClient(self.spreadsheet, worksheet)
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        ws = self.client._select_worksheet(worksheet)
+        ws._call("read")
+        return ws.frame()
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        ws = self.client._select_worksheet(worksheet)
+        ws._call("update")
+        ws.values = [[str(v) for v in r] for r in _values(data)]
+        ws._touch()
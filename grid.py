@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from indexes import _folded, _strings, words
+from schema import ARTIGO_OPTIONS, CENTS, FINANCIAL_COLUMNS, STATUS_OPTIONS, to_cents
+
+# Página Registros: colunas da tabela, filtros por valor e tamanhos de página
+GRID_COLUMNS = ['ID', 'NUMERO_DO_PROCESSO', 'REQUERENTE', 'CLIENTE', 'ARTIGO', 'STATUS', *FINANCIAL_COLUMNS]
+FILTER_COLUMNS = ['STATUS', 'ARTIGO']  # poucos valores: lista completa de opções
+TEXT_FILTER_COLUMNS = ['CLIENTE']  # um valor por cliente: filtro pelo texto digitado
+PAGE_SIZES = [25, 50, 100]
+# Colunas que a edição em massa altera; SALDO_DEVEDOR é recalculado
+EDITABLE_COLUMNS = ['CLIENTE', 'ARTIGO', 'STATUS', 'VALOR_HONORARIOS', 'VALOR_PAGO']
+_CHOICES = {'STATUS': STATUS_OPTIONS, 'ARTIGO': ARTIGO_OPTIONS}
+
+
+def _bitmaps(values):
+    # valor -> linhas com o valor, em bits (np.packbits: 1 byte a cada 8
+    # linhas). Vazio não entra; o custo total é proporcional às linhas.
+    codes, uniques = pd.factorize(values.astype('string'), sort=True)
+    positions = np.flatnonzero(codes >= 0)
+    order = np.argsort(codes[positions], kind='stable')
+    positions = positions[order]
+    bounds = np.searchsorted(codes[positions], np.arange(len(uniques) + 1))
+    size = (len(values) + 7) // 8
+    bits = (128 >> (positions & 7)).astype(np.float64)
+    maps = {}
+    for k, value in enumerate(uniques):
+        part = slice(bounds[k], bounds[k + 1])
+        # Cada linha acende um bit diferente do byte: somar é o mesmo que OU
+        maps[str(value)] = np.bincount(positions[part] >> 3, weights=bits[part], minlength=size).astype(np.uint8)
+    return maps
+
+
+def display(data):
+    # Linhas no formato de exibição: R$ em vez de centavos, categorias como texto
+    data = data.copy()
+    for col in data.columns:
+        if col in FINANCIAL_COLUMNS:
+            data[col] = data[col].astype('Float64') / CENTS
+        elif isinstance(data[col].dtype, pd.CategoricalDtype):
+            data[col] = data[col].astype('string')
+    return data
+
+
+class RecordGrid:
+    # Tabela da página Registros, montada uma vez por versão dos dados.
+    # Cada valor de STATUS/ARTIGO tem a sua máscara pronta: filtrar é um OU
+    # entre os valores escolhidos da mesma coluna e um E entre as colunas,
+    # sem varrer o DataFrame. CLIENTE é filtrado pelo texto digitado (sem
+    # acento, todas as palavras), conferido só nos valores distintos. A
+    # ordem de cada coluna e os valores distintos de cada coluna de texto
+    # são calculados no primeiro uso e ficam guardados.
+
+    def __init__(self, data, bitmaps, saldo):
+        self.data = data
+        self.size = len(data)
+        self.columns = [c for c in GRID_COLUMNS if c in data.columns]
+        self.bitmaps = bitmaps
+        self.saldo = saldo  # linhas com SALDO_DEVEDOR > 0
+        self._all = np.packbits(np.ones(self.size, dtype=bool))
+        self._orders = {}
+        self._texts = {}  # coluna -> (valores distintos sem acento, código de cada linha)
+
+    @classmethod
+    def build(cls, data):
+        bitmaps = {col: _bitmaps(data[col]) for col in FILTER_COLUMNS if col in data.columns}
+        saldo = data['SALDO_DEVEDOR'].gt(0).fillna(False).to_numpy(dtype=bool) if 'SALDO_DEVEDOR' in data.columns \
+            else np.zeros(len(data), dtype=bool)
+        return cls(data, bitmaps, np.packbits(saldo))
+
+    def values(self, col):
+        # Opções do filtro (valores presentes nesta versão)
+        return list(self.bitmaps.get(col, {}))
+
+    def _text_bits(self, col, text):
+        # Linhas cujo valor tem todas as palavras do texto
+        if col not in self._texts:
+            encoded = pc.dictionary_encode(_strings(self.data[col].astype('string')))
+            codes = pc.fill_null(encoded.indices, -1).to_numpy()
+            self._texts[col] = (_folded(encoded.dictionary), codes)
+        dictionary, codes = self._texts[col]
+        hit = np.ones(len(dictionary) + 1, dtype=bool)
+        hit[-1] = False  # vazio (código -1) nunca passa
+        for term in words(text):
+            hit[:-1] &= pc.match_substring(dictionary, term).to_numpy(zero_copy_only=False)
+        return np.packbits(hit[codes])
+
+    def mask(self, filters, saldo=False):
+        # filters: {coluna: [valores]}, ou {coluna: texto} nas colunas de
+        # TEXT_FILTER_COLUMNS; lista ou texto vazio não filtra a coluna
+        bits = self._all
+        for col, chosen in filters.items():
+            if col in TEXT_FILTER_COLUMNS:
+                if words(chosen or "") and col in self.data.columns:
+                    bits = bits & self._text_bits(col, chosen)
+                continue
+            if not chosen:
+                continue
+            maps = self.bitmaps.get(col, {})
+            union = np.zeros_like(bits)
+            for value in chosen:
+                if value in maps:
+                    union |= maps[value]
+            bits = bits & union
+        if saldo:
+            bits = bits & self.saldo
+        return np.unpackbits(bits, count=self.size).view(bool)
+
+    def order(self, col, descending=False):
+        # Posições das linhas ordenadas pela coluna (vazios por último);
+        # texto compara sem acento e sem caixa, como o seletor do Gerenciar
+        key = (col, descending)
+        if key not in self._orders:
+            values = self.data[col]
+            if pd.api.types.is_numeric_dtype(values):
+                values = pa.array(values, from_pandas=True)
+            else:
+                # Só os valores distintos passam pelo fold (nomes se repetem muito)
+                encoded = pc.dictionary_encode(_strings(values.astype('string')))
+                values = pa.DictionaryArray.from_arrays(encoded.indices, _folded(encoded.dictionary))
+            # Ordenação do Arrow: estável e bem mais rápida que a de objetos
+            order = pc.array_sort_indices(values, order="descending" if descending else "ascending", null_placement="at_end")
+            self._orders[key] = order.to_numpy()
+        return self._orders[key]
+
+    def rows(self, filters, saldo=False, sort='REQUERENTE', descending=False):
+        # Posições das linhas que passam no filtro, já na ordem pedida
+        order = self.order(sort, descending)
+        return order[self.mask(filters, saldo)[order]]
+
+    def page(self, rows, number, size, extra=()):
+        # Só as linhas da página vão para o navegador; extra: colunas além
+        # das da tabela (ex.: VERSAO para a edição em massa)
+        start = (number - 1) * size
+        columns = self.columns + [c for c in extra if c in self.data.columns]
+        return display(self.data.iloc[rows[start:start + size]][columns])
+
+
+def _text(values):
+    return values.astype('string').fillna('').str.strip()
+
+
+def bulk_changes(before, after):
+    # Diferença entre a página como foi carregada (before) e como voltou do
+    # editor (after), célula a célula e sem laço por linha. Devolve as
+    # operações de gravação (só os campos alterados, no formato de
+    # apply_batch) e os erros de validação, [(ID, mensagem)].
+    columns = [c for c in EDITABLE_COLUMNS if c in before.columns]
+    changed = pd.DataFrame(index=before.index)
+    for col in columns:
+        if col in FINANCIAL_COLUMNS:
+            changed[col] = to_cents(before[col]).ne(to_cents(after[col]))
+        else:
+            changed[col] = _text(before[col]).ne(_text(after[col]))
+    touched = changed.any(axis=1)
+
+    errors = []
+    for col in columns:
+        if col in _CHOICES:
+            bad = changed[col] & ~_text(after[col]).isin(_CHOICES[col])
+        elif col in FINANCIAL_COLUMNS:
+            amount = pd.to_numeric(after[col], errors='coerce')
+            bad = changed[col] & (amount.isna() | amount.lt(0)).fillna(True)
+        else:
+            continue
+        errors += [(int(i), f"{col}: valor inválido ({v})") for i, v in zip(before['ID'][bad], after[col][bad])]
+    if errors:
+        return [], errors
+
+    saldo = None
+    if 'SALDO_DEVEDOR' in before.columns and {'VALOR_HONORARIOS', 'VALOR_PAGO'} <= set(columns):
+        # Saldo refeito (em centavos, exato) nas linhas com valor alterado
+        repriced = changed['VALOR_HONORARIOS'] | changed['VALOR_PAGO']
+        saldo = (to_cents(after['VALOR_HONORARIOS']) - to_cents(after['VALOR_PAGO'])) / CENTS
+
+    # Daqui em diante só as linhas alteradas: o custo segue o número de edições
+    ops = []
+    for i in np.flatnonzero(touched.to_numpy()):
+        fields = {}
+        for col in columns:
+            if changed[col].iat[i]:
+                value = after[col].iat[i]
+                fields[col] = float(value) if col in FINANCIAL_COLUMNS else ('' if pd.isna(value) else str(value).strip())
+        if saldo is not None and repriced.iat[i]:
+            fields['SALDO_DEVEDOR'] = float(saldo.iat[i])
+        version = before['VERSAO'].iat[i] if 'VERSAO' in before.columns else None
+        ops.append({
+            'op': 'update', 'id': int(before['ID'].iat[i]), 'fields': fields,
+            'expected_version': None if version is None else int(version),
+        })
+    return ops, errors
@@ -0,0 +1,300 @@
+import argparse
+import codecs
+import csv
+import datetime as dt
+import hashlib
+import io
+import itertools
+import json
+import os
+
+import pandas as pd
+import pyarrow.compute as pc
+
+from data_cache import append_rows
+from indexes import _folded
+from schema import (
+    ARTIGO_OPTIONS, CENTS, COLUMNS, DATE_FORMAT, FINANCIAL_COLUMNS, HEADER_SCAN, STATUS_OPTIONS, SchemaError,
+    check_columns, normalize_columns, to_cents,
+)
+
+# Importação de CSV/XLSX em blocos: o arquivo é lido aos pedaços (nunca
+# inteiro num DataFrame), cada bloco é validado de uma vez, recebe um bloco
+# de IDs e é gravado num único lote. Depois de cada bloco um ponto de
+# controle (JSON) guarda até onde foi; a mesma importação, chamada de novo
+# com o mesmo arquivo, continua dali.
+#
+#   python importer.py escritorio.xlsx
+#   python importer.py escritorio.csv --chunk 500
+
+CHUNK_ROWS = 1000
+MAX_ERRORS = 200  # erros guardados para mostrar; a contagem vai inteira
+# O ID vem da sequência e a VERSAO é do controle de concorrência
+IMPORT_COLUMNS = [c for c in COLUMNS if c not in ('ID', 'VERSAO')]
+_ARTIGOS = {a.casefold(): a for a in ARTIGO_OPTIONS}
+
+
+# --- LEITURA EM BLOCOS ---
+# Cada leitor gera (bloco, fração lida). O bloco tem o cabeçalho do arquivo
+# e só texto; o índice é o número da linha no arquivo, para as mensagens.
+
+def _header_index(rows):
+    # Primeira linha que traz REQUERENTE (acima dela, títulos)
+    for i, values in enumerate(rows):
+        if 'REQUERENTE' in normalize_columns([v for v in values if v is not None]):
+            return i
+    raise SchemaError(f"Cabeçalho com REQUERENTE não encontrado nas primeiras {HEADER_SCAN + 1} linhas do arquivo.")
+
+
+def _size(f):
+    start = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(start)
+    return size
+
+
+def _encoding(f):
+    # UTF-8 (com ou sem BOM) se o arquivo inteiro decodifica como UTF-8;
+    # senão cp1252, como o Excel salva CSV no Windows em português
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    try:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            decoder.decode(block)
+        decoder.decode(b"", final=True)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1252"
+    finally:
+        f.seek(0)
+
+
+def csv_chunks(f, chunk_rows=CHUNK_ROWS, encoding=None):
+    # f: arquivo binário. Codificação (se não informada) e separador
+    # (vírgula, ponto e vírgula ou tab) deduzidos do arquivo
+    size = _size(f) or 1
+    encoding = encoding or _encoding(f)
+    sample = f.read(64 * 1024).decode(encoding, errors="ignore")
+    f.seek(0)
+    try:
+        sep = csv.Sniffer().sniff(sample, delimiters=",;\t").delimiter
+    except csv.Error:
+        sep = ","
+    skip = _header_index(itertools.islice(csv.reader(io.StringIO(sample), delimiter=sep), HEADER_SCAN + 1))
+    reader = pd.read_csv(
+        f, sep=sep, skiprows=skip, dtype=str, keep_default_na=False, encoding=encoding, chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        chunk.index = chunk.index + skip + 2
+        yield chunk, min(f.tell() / size, 1.0)
+
+
+def _cell(value):
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.strftime(DATE_FORMAT)
+    return "" if value is None else str(value)
+
+
+def xlsx_chunks(f, chunk_rows=CHUNK_ROWS):
+    # openpyxl em modo read_only: as linhas vêm do XML conforme são lidas.
+    # Só quem importa XLSX precisa do openpyxl
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(f, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total = sheet.max_row or 0
+        rows = sheet.iter_rows(values_only=True)
+        scan = list(itertools.islice(rows, HEADER_SCAN + 1))
+        skip = _header_index(scan)
+        header = [_cell(v) for v in scan[skip]]
+        line = skip + 2
+        pending = iter(scan[skip + 1:])
+        while True:
+            block = [[_cell(v) for v in row] for row in itertools.islice(itertools.chain(pending, rows), chunk_rows)]
+            if not block:
+                break
+            chunk = pd.DataFrame([row[:len(header)] for row in block], columns=header).fillna("")
+            chunk.index = range(line, line + len(block))
+            line += len(block)
+            yield chunk, min(line / total, 1.0) if total else None
+    finally:
+        workbook.close()
+
+
+def read_chunks(f, name, chunk_rows=CHUNK_ROWS):
+    if name.lower().endswith((".xlsx", ".xlsm")):
+        return xlsx_chunks(f, chunk_rows)
+    return csv_chunks(f, chunk_rows)
+
+
+# --- VALIDAÇÃO ---
+
+def _text(values):
+    # Texto sem espaços nas pontas; vazio vira NA
+    values = values.astype('string').str.strip()
+    return values.mask(values == "")
+
+
+def _key_part(values):
+    # Comparação sem acento, caixa ou espaços repetidos (como indexes.fold)
+    folded = pc.utf8_trim_whitespace(pc.replace_substring_regex(_folded(values), pattern=r"\s+", replacement=" "))
+    return pd.Series(folded.to_numpy(zero_copy_only=False), index=values.index).fillna("")
+
+
+def duplicate_keys(data):
+    # Chave de duplicidade: o nº do processo, quando existe; senão requerente + cliente
+    blank = pd.Series("", index=data.index)
+    processo = _key_part(data['NUMERO_DO_PROCESSO'].astype('string')) if 'NUMERO_DO_PROCESSO' in data.columns else blank
+    cliente = _key_part(data['CLIENTE'].astype('string')) if 'CLIENTE' in data.columns else blank
+    nome = "n:" + _key_part(data['REQUERENTE'].astype('string')) + "|" + cliente
+    return nome.where(processo == "", "p:" + processo)
+
+
+def prepare(chunk):
+    # Bloco lido -> (linhas prontas para gravar, sem ID; erros por linha).
+    # Mesma padronização de cabeçalho e de valores da carga dos dados.
+    chunk = chunk.copy()
+    chunk.columns = normalize_columns(chunk.columns)
+    data = pd.DataFrame({c: _text(chunk[c]) for c in IMPORT_COLUMNS if c in chunk.columns}, index=chunk.index)
+    problems = pd.Series("", index=data.index)
+
+    def flag(bad, message):
+        nonlocal problems
+        problems = problems.where(~bad.fillna(False).astype(bool), problems + message + "; ")
+
+    flag(data['REQUERENTE'].isna(), "REQUERENTE vazio")
+    # Sem status, como o padrão do formulário de inclusão
+    status = data['STATUS'].str.upper() if 'STATUS' in data.columns else pd.Series(pd.NA, index=data.index, dtype='string')
+    status = status.fillna(STATUS_OPTIONS[0])
+    flag(~status.isin(STATUS_OPTIONS), "STATUS desconhecido")
+    data['STATUS'] = status
+    if 'ARTIGO' in data.columns:
+        artigo = data['ARTIGO'].str.casefold().map(_ARTIGOS)
+        flag(data['ARTIGO'].notna() & artigo.isna(), "ARTIGO desconhecido")
+        data['ARTIGO'] = artigo
+    for col in FINANCIAL_COLUMNS:
+        if col in data.columns:
+            amount = pd.to_numeric(data[col], errors='coerce')
+            flag(data[col].notna() & (amount.isna() | amount.lt(0)), f"{col} inválido")
+    if 'ANIVERSARIO' in data.columns:
+        dates = pd.to_datetime(data['ANIVERSARIO'], format=DATE_FORMAT, errors='coerce')
+        flag(data['ANIVERSARIO'].notna() & dates.isna(), f"ANIVERSARIO fora do formato {DATE_FORMAT}")
+
+    # Valores como o formulário de inclusão grava: R$ e saldo = honorários - pago
+    cents = {col: to_cents(data[col]) if col in data.columns else pd.Series(0, index=data.index, dtype='Int64')
+             for col in ('VALOR_HONORARIOS', 'VALOR_PAGO')}
+    for col, value in cents.items():
+        data[col] = value / CENTS
+    data['SALDO_DEVEDOR'] = (cents['VALOR_HONORARIOS'] - cents['VALOR_PAGO']) / CENTS
+
+    bad = problems != ""
+    errors = [(line, message.rstrip("; ")) for line, message in problems[bad].items()]
+    return data[~bad], errors
+
+
+# --- IMPORTAÇÃO ---
+
+def file_digest(f):
+    # Identifica o arquivo para o ponto de controle (lido aos pedaços)
+    digest = hashlib.sha1()
+    for block in iter(lambda: f.read(1 << 20), b""):
+        digest.update(block)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    # Progresso de uma importação, gravado depois de cada bloco
+    def __init__(self, directory, digest):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{digest}.json")
+        self.state = {"linha": 0, "importados": 0, "duplicados": 0, "erros": 0, "concluido": False}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as fh:
+                self.state.update(json.load(fh))
+
+    def save(self, **changes):
+        self.state.update(changes)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh)
+        os.replace(tmp, self.path)
+
+
+class Importer:
+    # existing: dados atuais (normalizados), para achar registros já cadastrados
+
+    def __init__(self, storage, existing, checkpoint_dir="importacoes", chunk_rows=CHUNK_ROWS):
+        self.storage = storage
+        self.keys = set(duplicate_keys(existing)) if len(existing) else set()
+        self.checkpoint_dir = checkpoint_dir
+        self.chunk_rows = chunk_rows
+        self.errors = []  # [(linha, mensagem)], até MAX_ERRORS
+
+    def run(self, f, name, progress=None):
+        # progress(fração ou None, estado): chamado depois de cada bloco
+        checkpoint = Checkpoint(self.checkpoint_dir, file_digest(f))
+        if checkpoint.state["concluido"]:
+            return checkpoint.state
+        for chunk, fraction in read_chunks(f, name, self.chunk_rows):
+            # Linhas gravadas numa execução anterior
+            chunk = chunk[chunk.index > checkpoint.state["linha"]]
+            if chunk.empty:
+                continue
+            check_columns([c for c in chunk.columns], expected=['REQUERENTE'])
+            rows, errors = prepare(chunk)
+            self.errors += errors[:MAX_ERRORS - len(self.errors)]
+
+            keys = duplicate_keys(rows)
+            # Já cadastrado, ou repetido no próprio arquivo
+            dup = pd.Series([k in self.keys for k in keys.tolist()], index=keys.index) | keys.duplicated()
+            rows = rows[~dup]
+            if len(rows):
+                ids = self.storage.next_ids(len(rows))
+                records = rows.astype(object).where(rows.notna(), "").to_dict("records")
+                for record, record_id in zip(records, ids):
+                    record['ID'] = record_id
+                append_rows(self.storage, records)
+                self.keys.update(keys[~dup])
+            state = checkpoint.state
+            checkpoint.save(
+                linha=int(chunk.index[-1]),
+                importados=state["importados"] + len(rows),
+                duplicados=state["duplicados"] + int(dup.sum()),
+                erros=state["erros"] + len(errors),
+            )
+            if progress is not None:
+                progress(fraction, checkpoint.state)
+        checkpoint.save(concluido=True)
+        return checkpoint.state
+
+
+def main():
+    from data_cache import dataset
+    from schema import RECORD_COLUMNS, normalize
+    from storage import get_storage, setting
+
+    parser = argparse.ArgumentParser(description="Importa um CSV/XLSX para a aba NACIONALIDADE")
+    parser.add_argument("arquivo")
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS, help="linhas por bloco (e por lote gravado)")
+    args = parser.parse_args()
+
+    storage = get_storage()
+    existing = dataset(storage, normalize, RECORD_COLUMNS).data
+    importer = Importer(storage, existing, setting("import_dir", "importacoes"), args.chunk)
+
+    def progress(fraction, state):
+        done = "" if fraction is None else f"{fraction:6.1%} "
+        print(f"{done}linha {state['linha']}: {state['importados']} importado(s), "
+              f"{state['duplicados']} duplicado(s), {state['erros']} com erro", flush=True)
+
+    with open(args.arquivo, "rb") as f:
+        state = importer.run(f, args.arquivo, progress)
+    print(f"Concluído: {state['importados']} importado(s), {state['duplicados']} duplicado(s), {state['erros']} com erro")
+    for line, message in importer.errors:
+        print(f"  linha {line}: {message}")
+
+
+if __name__ == "__main__":
+    main()
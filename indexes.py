@@ -0,0 +1,205 @@
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Colunas da busca da página Gerenciar e quantos resultados vão para a tela
+SEARCH_COLUMNS = ['REQUERENTE', 'CLIENTE', 'E_MAIL', 'NUMERO_DO_PROCESSO']
+SEARCH_LIMIT = 20
+
+
+def fold(text):
+    # Chave de comparação: sem acentos, sem diferença de caixa/espaços
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+def _strings(values):
+    # Coluna de texto como um único array Arrow
+    values = pa.array(values, type=pa.string(), from_pandas=True)
+    if isinstance(values, pa.ChunkedArray):
+        # Coluna que já vem do Arrow em pedaços (ex.: depois de uma inclusão)
+        values = values.combine_chunks()
+    return values
+
+
+def _folded(values):
+    # fold() vetorizado (Arrow) para colunas inteiras: sem acentos, minúsculas
+    text = pc.utf8_normalize(_strings(values), form="NFKD")
+    return pc.utf8_lower(pc.replace_substring_regex(text, pattern=r"\p{Mn}", replacement=""))
+
+
+def _split(folded):
+    # (posição de origem, palavra) de cada palavra; vazios ficam de fora
+    parts = pc.split_pattern_regex(folded, pattern="[^a-z0-9]+")
+    rows = pc.list_parent_indices(parts).to_numpy()
+    flat = pc.list_flatten(parts)
+    keep = pc.not_equal(flat, "")
+    return rows[keep.to_numpy(zero_copy_only=False)], flat.filter(keep)
+
+
+def words(text):
+    # "Conceição-Romão, 2024/0240" -> ["conceicao", "romao", "2024", "0240"]
+    return _split(_folded([str(text)]))[1].to_pylist()
+
+
+def _grouped(keys, values):
+    # Agrupa por chave: (chaves ordenadas, deslocamentos, ordem). Os itens da
+    # chave i são order[offsets[i]:offsets[i + 1]] (posições em keys), com
+    # os values de cada chave em ordem crescente
+    encoded = pc.dictionary_encode(keys)
+    by_value = pc.array_sort_indices(encoded.dictionary).to_numpy()
+    position = np.empty_like(by_value)
+    position[by_value] = np.arange(len(by_value))
+    codes = position[encoded.indices.to_numpy()]
+    order = np.lexsort((values, codes))
+    offsets = np.searchsorted(codes[order], np.arange(len(by_value) + 1))
+    return encoded.dictionary.take(pa.array(by_value)), offsets, order
+
+
+class RecordIndex:
+    # Índices da página Gerenciar, montados uma vez por versão dos dados:
+    # ID -> posição da linha, nome normalizado -> IDs e a lista já ordenada
+    # para o seletor (homônimos aparecem separados, com o ID no rótulo).
+
+    def __init__(self, positions, by_name, choices, labels, missing_ids):
+        self.positions = positions
+        self.by_name = by_name
+        self.choices = choices
+        self.labels = labels
+        self.missing_ids = missing_ids
+
+    @classmethod
+    def build(cls, data):
+        positions, by_name, names = {}, {}, {}
+        missing_ids = 0
+        ids = data['ID'].tolist() if 'ID' in data.columns else [None] * len(data)
+        for pos, (record_id, name) in enumerate(zip(ids, data['REQUERENTE'].tolist())):
+            if record_id is None or pd.isna(record_id):
+                missing_ids += 1
+                continue
+            record_id = int(record_id)
+            positions.setdefault(record_id, pos)
+            by_name.setdefault(fold(name), []).append(record_id)
+            names[record_id] = str(name).strip()
+
+        choices = sorted(positions, key=lambda i: (fold(names[i]), i))
+        labels = {
+            i: names[i] if len(by_name[fold(names[i])]) == 1 else f"{names[i]} (ID {i})"
+            for i in choices
+        }
+        return cls(positions, by_name, choices, labels, missing_ids)
+
+    def row(self, data, record_id):
+        return data.iloc[self.positions[int(record_id)]]
+
+
+class SearchIndex:
+    # Busca da página Gerenciar, montada uma vez por versão dos dados, sobre
+    # as palavras (sem acento) de SEARCH_COLUMNS. Palavra -> linhas fica em
+    # arrays ordenados: o prefixo é uma busca binária no vocabulário e os
+    # trigramas das palavras acham trechos do meio (e-mail, nº do processo).
+    # Várias palavras na consulta: a linha precisa ter todas.
+
+    def __init__(self, ids, rank, vocabulary, offsets, rows, primary, trigrams, trigram_offsets, trigram_words):
+        self.ids = ids  # posição -> ID (-1 sem ID)
+        self.rank = rank  # posição -> ordem alfabética do requerente
+        self.vocabulary = vocabulary  # palavras ordenadas (Arrow)
+        self._sorted = vocabulary.to_numpy(zero_copy_only=False)  # para a busca binária
+        self.offsets = offsets
+        self.rows = rows
+        self.primary = primary  # a palavra veio do REQUERENTE
+        self.trigrams = trigrams.to_numpy(zero_copy_only=False)
+        self.trigram_offsets = trigram_offsets
+        self.trigram_words = trigram_words
+
+    @classmethod
+    def build(cls, data):
+        found_rows, found_words, found_primary = [], [], []
+        for col in SEARCH_COLUMNS:
+            if col in data.columns:
+                rows, found = _split(_folded(data[col]))
+                found_rows.append(rows)
+                found_words.append(found)
+                found_primary.append(np.full(len(rows), col == 'REQUERENTE'))
+        rows = np.concatenate(found_rows)
+        vocabulary, offsets, order = _grouped(pa.concat_arrays(found_words), rows)
+        rows = rows[order]
+        primary = np.concatenate(found_primary)[order]
+
+        # Trigramas de cada palavra do vocabulário, uma fatia por vez
+        lengths = pc.utf8_length(vocabulary).to_numpy()
+        found_trigrams, found_ids = [pa.array([], type=pa.string())], [np.empty(0, dtype=int)]
+        for start in range(max(lengths.max(initial=0) - 2, 0)):
+            ids = np.flatnonzero(lengths >= start + 3)
+            found_trigrams.append(pc.utf8_slice_codeunits(vocabulary.take(pa.array(ids)), start, start + 3))
+            found_ids.append(ids)
+        trigram_words = np.concatenate(found_ids)
+        trigrams, trigram_offsets, order = _grouped(pa.concat_arrays(found_trigrams), trigram_words)
+        trigram_words = trigram_words[order]
+
+        ids = data['ID'].astype('Float64').fillna(-1).to_numpy(dtype=np.int64) if 'ID' in data.columns \
+            else np.full(len(data), -1)
+        names, _ = pd.factorize(pd.Series(_folded(data['REQUERENTE']), dtype=object), sort=True)
+        rank = np.empty(len(data), dtype=int)
+        rank[np.lexsort((ids, names))] = np.arange(len(data))
+        return cls(ids, rank, vocabulary, offsets, rows, primary, trigrams, trigram_offsets, trigram_words)
+
+    def _matching_words(self, term):
+        # (palavras que contêm o termo, palavras que começam com ele)
+        lo = np.searchsorted(self._sorted, term, side="left")
+        hi = np.searchsorted(self._sorted, term + "\uffff", side="left")
+        prefix = np.arange(lo, hi)
+        if len(term) < 3:
+            return prefix, prefix
+        postings = []
+        for start in range(len(term) - 2):
+            i = np.searchsorted(self.trigrams, term[start:start + 3])
+            if i == len(self.trigrams) or self.trigrams[i] != term[start:start + 3]:
+                return prefix, prefix
+            postings.append(self.trigram_words[self.trigram_offsets[i]:self.trigram_offsets[i + 1]])
+        # Interseção a partir da lista mais curta (todas estão ordenadas)
+        postings.sort(key=len)
+        candidates = postings[0]
+        for found in postings[1:]:
+            at = np.minimum(np.searchsorted(found, candidates), len(found) - 1)
+            candidates = candidates[found[at] == candidates]
+        # Os trigramas estão na palavra, mas não necessariamente em sequência
+        inside = pc.match_substring(self.vocabulary.take(pa.array(candidates)), term)
+        return np.union1d(candidates[inside.to_numpy(zero_copy_only=False)], prefix), prefix
+
+    def _rows_of(self, word_ids, primary=False):
+        # Junta as listas de linhas das palavras sem laço em Python
+        starts = self.offsets[word_ids]
+        counts = self.offsets[word_ids + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        rows = self.rows[positions]
+        if primary:
+            rows = rows[self.primary[positions]]
+        return np.unique(rows)
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        # IDs das linhas que têm todas as palavras da consulta: primeiro as
+        # em que todas começam uma palavra do requerente, depois as demais,
+        # cada grupo em ordem alfabética
+        matched = first = None
+        for term in words(text):
+            inside, prefix = self._matching_words(term)
+            rows, starts = self._rows_of(inside), self._rows_of(prefix, primary=True)
+            matched = rows if matched is None else np.intersect1d(matched, rows)
+            first = starts if first is None else np.intersect1d(first, starts)
+        if matched is None or not len(matched):
+            return []
+        matched = matched[self.ids[matched] >= 0]
+        order = np.lexsort((self.rank[matched], ~np.isin(matched, first)))
+        result = []
+        for record_id in self.ids[matched[order]]:
+            record_id = int(record_id)
+            if record_id not in result:
+                result.append(record_id)
+                if len(result) == limit:
+                    break
+        return result
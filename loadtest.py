@@ -0,0 +1,224 @@
+import argparse
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import benchmark
+from benchmark import _SCRIPT, _check, _menu
+from data_cache import shared_cache
+from fake_gsheets import FakeConnection, synthetic_sheet
+from schema import normalize_columns
+from storage import _enabled, setting, sheets_storage
+
+# Teste de carga sem rede: N sessões simultâneas (uma AppTest por thread)
+# navegam pelo app e gravam na mesma planilha falsa. Cada edição acrescenta
+# uma marca única em OBSERVACOES; no fim, toda marca confirmada ao usuário
+# precisa estar na planilha (senão foi uma atualização perdida), assim como
+# toda inclusão confirmada, e nenhum ID pode aparecer duas vezes.
+#
+# A AppTest usa um Runtime global do Streamlit, então os reruns em si rodam
+# um de cada vez; a concorrência está entre eles: enquanto uma sessão
+# "digita" (--think) com o formulário aberto, as outras leem e gravam.
+#
+#   python loadtest.py --sessions 8 --steps 20 --latency 0.1
+#   python loadtest.py --app streamlit_app05.py --hot 3
+#   NACIONALIDADE_WRITE_BEHIND=true python loadtest.py   (espera o diário esvaziar)
+
+_RERUN = threading.Lock()
+
+
+class Session:
+    def __init__(self, number, args, hot):
+        self.number = number
+        self.args = args
+        self.hot = hot  # registros disputados: [(ID, nome)]
+        self.rng = random.Random(args.seed * 1000 + number)
+        self.at = AppTest.from_string(_SCRIPT.format(path=args.app), default_timeout=args.timeout)
+        self.timings = []  # (ação, segundos) por rerun
+        self.saved = []  # inclusões confirmadas: nome
+        self.edited = []  # edições confirmadas: (ID, nome, marca)
+        self.conflicts = 0
+        self.errors = []
+
+    def _timed(self, action, fn):
+        with _RERUN:
+            start = time.perf_counter()
+            fn()
+            self.timings.append((action, time.perf_counter() - start))
+        _check(self.at)
+
+    def _button(self, *labels):
+        return next(b for b in self.at.button if any(label in b.label for label in labels))
+
+    def dashboard(self):
+        self._timed("Dashboard", lambda: _menu(self.at, "📊"))
+
+    def add(self, step):
+        self._timed("abrir Inclusão", lambda: _menu(self.at, "➕"))
+        name = f"Carga S{self.number} N{step}"
+        next(t for t in self.at.text_input if "Requerente" in t.label).input(name)
+        self._timed("salvar inclusão", lambda: self._button("Salvar", "Finalizar").click().run())
+        self.saved.append(name)
+
+    def edit(self, step):
+        self._timed("abrir Gerenciar", lambda: _menu(self.at, "📝"))
+        record_id, name = self.rng.choice(self.hot)
+        picker = next(s for s in self.at.selectbox if s.label.startswith(("Selecione", "Pesquisar")))
+        if isinstance(picker.value, str):
+            self._timed("selecionar registro", lambda: picker.set_value(name).run())
+        else:
+            # Versão atual: a lista só traz o que a busca encontrou
+            box = next(t for t in self.at.text_input if t.label == "Pesquisar")
+            self._timed("pesquisar", lambda: box.input(name).run())
+            picker = next(s for s in self.at.selectbox if s.label.startswith("Selecione"))
+            self._timed("selecionar registro", lambda: picker.set_value(record_id).run())
+        # Tempo de digitação: outra sessão pode gravar o mesmo registro
+        time.sleep(self.rng.uniform(0, self.args.think))
+        mark = f"[S{self.number}-{step}]"
+        obs = next(t for t in self.at.text_area if t.label == "Observações")
+        obs.input(f"{obs.value or ''} {mark}".strip())
+        self._timed("gravar edição", lambda: self._button("Gravar", "Salvar Alterações").click().run())
+        if "conflito" in self.at.session_state:
+            # Versão atual detectou a concorrência: o usuário desiste da alteração
+            self.conflicts += 1
+            self._timed("descartar conflito", lambda: self._button("Descartar").click().run())
+        else:
+            self.edited.append((record_id, name, mark))
+
+    def run(self):
+        self._timed("carga inicial", self.at.run)
+        for step in range(self.args.steps):
+            action = self.rng.choices(["dashboard", "add", "edit"], self.args.mix)[0]
+            try:
+                if action == "dashboard":
+                    self.dashboard()
+                elif action == "add":
+                    self.add(step)
+                else:
+                    self.edit(step)
+            except Exception as e:
+                self.errors.append(f"{action}: {type(e).__name__}: {e}")
+            time.sleep(self.rng.uniform(0, self.args.think))
+        return self
+
+
+def check(conn, sessions):
+    # Confere a planilha final contra o que cada sessão viu confirmado
+    final = conn.read()
+    final.columns = normalize_columns(final.columns)
+    ids = final['ID'].dropna()
+    duplicate_ids = {int(i): n for i, n in Counter(ids).items() if n > 1}
+    names = set(final['REQUERENTE'].dropna())
+    obs_by_id = dict(zip(final['ID'], final['OBSERVACOES'].fillna('').astype(str)))
+    obs_by_name = {}
+    for name, obs in zip(final['REQUERENTE'], final['OBSERVACOES'].fillna('').astype(str)):
+        obs_by_name[name] = obs_by_name.get(name, '') + obs
+
+    lost_inserts = [n for s in sessions for n in s.saved if n not in names]
+    lost_updates = [
+        (record_id, mark) for s in sessions for record_id, name, mark in s.edited
+        if mark not in obs_by_id.get(record_id, '') and mark not in obs_by_name.get(name, '')
+    ]
+    return duplicate_ids, lost_inserts, lost_updates
+
+
+def drain(journal_path, interval, timeout=60):
+    # Write-behind: espera o diário esvaziar antes de conferir a planilha.
+    # Devolve quantas operações o backend recusou no envio.
+    db = sqlite3.connect(journal_path)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not db.execute("SELECT COUNT(*) FROM journal WHERE status = 'pending'").fetchone()[0]:
+            break
+        time.sleep(interval / 2)
+    failed = db.execute("SELECT COUNT(*) FROM journal WHERE status = 'failed'").fetchone()[0]
+    db.close()
+    return failed
+
+
+def report(args, sessions, conn, elapsed, failed=None):
+    timings = [t for s in sessions for t in s.timings]
+    print(f"app {args.app}: {args.sessions} sessões x {args.steps} passos, {args.rows} linhas,"
+          f" latência {args.latency}s, {elapsed:.1f}s no total")
+    print(f"{'ação':<22} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'máx ms':>9}")
+    for action in sorted({a for a, _ in timings}):
+        values = np.array([t for a, t in timings if a == action]) * 1000
+        print(f"{action:<22} {len(values):>5} {np.percentile(values, 50):>9.0f}"
+              f" {np.percentile(values, 95):>9.0f} {values.max():>9.0f}")
+    values = np.array([t for _, t in timings]) * 1000
+    print(f"{'todas':<22} {len(values):>5} {np.percentile(values, 50):>9.0f}"
+          f" {np.percentile(values, 95):>9.0f} {values.max():>9.0f}")
+
+    calls = conn.spreadsheet.calls
+    print(f"\nchamadas ao backend: {sum(calls.values())} ({sum(calls.values()) / max(len(timings), 1):.1f} por rerun)")
+    print("  " + ", ".join(f"{name}={n}" for name, n in sorted(calls.items())))
+
+    # Mesmas instâncias que o app usou (cache_resource do processo)
+    api = sheets_storage(conn).api_stats()
+    cache = shared_cache()
+    print(f"API do Sheets: {api['requests']} requisições, {api['retried']} repetidas,"
+          f" {api['throttled']} sem cota, {api['failed']} com falha")
+    print(f"cache: {cache.reads} leituras, {cache.probes} conferências, {cache.stale} respostas com dados antigos")
+
+    duplicate_ids, lost_inserts, lost_updates = check(conn, sessions)
+    print(f"\nconflitos detectados pelo app: {sum(s.conflicts for s in sessions)}")
+    print(f"atualizações perdidas: {len(lost_updates)}", lost_updates[:10] or "")
+    print(f"inclusões perdidas: {len(lost_inserts)}", lost_inserts[:10] or "")
+    print(f"IDs duplicados: {len(duplicate_ids)}", dict(list(duplicate_ids.items())[:10]) or "")
+    if failed is not None:
+        print(f"write-behind: {failed} operação(ões) recusada(s) no envio")
+    errors = [e for s in sessions for e in s.errors]
+    if errors:
+        print(f"\nerros nas sessões: {len(errors)}")
+        for e in Counter(errors).most_common(5):
+            print(f"  {e[1]}x {e[0][:200]}")
+    return not (duplicate_ids or lost_inserts or lost_updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga com sessões simultâneas e planilha falsa")
+    parser.add_argument("--app", default="streamlit_app.py")
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--hot", type=int, default=5, help="quantos registros as edições disputam")
+    parser.add_argument("--mix", type=float, nargs=3, default=[0.4, 0.2, 0.4],
+                        metavar=("DASHBOARD", "INCLUSAO", "EDICAO"))
+    parser.add_argument("--think", type=float, default=0.2, help="pausa máxima entre ações (s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos por chamada à API falsa")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    # Cópia local de outra execução traria dados de outra planilha falsa
+    os.environ.setdefault("NACIONALIDADE_SNAPSHOT", "false")
+
+    data = synthetic_sheet(args.rows, seed=args.seed).dropna(subset=['Requerente'])
+    # Nomes únicos nos registros disputados: as versões antigas escolhem pelo nome
+    data = data.drop_duplicates(subset=['Requerente'], keep=False)
+    hot = list(zip(data['ID'].head(args.hot).astype(int), data['Requerente'].head(args.hot)))
+    benchmark.CONN = conn = FakeConnection(data, latency=args.latency)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    sessions = [Session(n, args, hot) for n in range(args.sessions)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.sessions) as pool:
+        list(pool.map(Session.run, sessions))
+    elapsed = time.perf_counter() - start
+    failed = None
+    if _enabled(setting("write_behind", False)):
+        failed = drain(setting("journal_path", "write_behind.db"), float(setting("flush_interval", 2.0)))
+    ok = report(args, sessions, conn, elapsed, failed)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
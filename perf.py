@@ -0,0 +1,234 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+import streamlit as st
+
+from storage import _enabled, setting
+
+# Medição por rerun: trechos (leitura, normalização, índice, agregados,
+# gráfico, gravação) cronometrados por sessão, mostrados no painel
+# "Desempenho" da barra lateral e acrescentados em JSON lines ao arquivo
+# perf_log. Ligado pela configuração perf = true; desligado, span() devolve
+# sempre o mesmo contexto vazio.
+
+HISTORY = 20  # reruns guardados por sessão para o painel
+PROFILE_TOP = 25  # funções no resumo do perfil
+
+_NULL = nullcontext()
+_local = threading.local()  # cada sessão roda o script na sua própria thread
+_log_lock = threading.Lock()
+
+
+class _Span:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        spans = self.recorder.spans
+        spans[self.name] = spans.get(self.name, 0.0) + elapsed
+        self.recorder.touched = self.start + elapsed
+        return False
+
+
+class Recorder:
+    def __init__(self, session):
+        self.session = session
+        self.started = self.touched = time.perf_counter()
+        self.when = datetime.now().isoformat(timespec="seconds")
+        self.spans = {}
+        self.tags = {}
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def result(self, ended):
+        # ended: "ok" (chegou ao finish), "rerun" (st.stop/st.rerun) ou "erro".
+        # No erro o fim real não é conhecido: conta até o último trecho medido
+        total = (self.touched if ended == "erro" else time.perf_counter()) - self.started
+        spans = {name: round(s, 4) for name, s in self.spans.items()}
+        # O que não caiu em nenhum trecho é montagem da página pelo Streamlit
+        spans["render"] = round(max(total - sum(self.spans.values()), 0.0), 4)
+        return {
+            "ts": self.when, "sessao": self.session, **self.tags,
+            "total": round(total, 4), "spans": spans, "fim": ended,
+        }
+
+
+def span(name):
+    recorder = getattr(_local, "recorder", None)
+    return _NULL if recorder is None else recorder.span(name)
+
+
+def tag(**tags):
+    recorder = getattr(_local, "recorder", None)
+    if recorder is not None:
+        recorder.tags.update(tags)
+
+
+def _session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id[:8] if ctx is not None else "-"
+
+
+def _close(ended):
+    _close_profile()
+    recorder = getattr(_local, "recorder", None)
+    if recorder is None:
+        return
+    _local.recorder = None
+    result = recorder.result(ended)
+    history = st.session_state.setdefault("_perf_historico", [])
+    history.append(result)
+    del history[:-HISTORY]
+    path = setting("perf_log", "perf.jsonl")
+    if path:
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def _closing(control):
+    # st.stop()/st.rerun() encerram o script por exceção, antes do finish():
+    # fecha a medição da sessão antes de repassar a chamada
+    @functools.wraps(control)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, "recorder", None) is not None or getattr(_local, "profiler", None) is not None:
+            _close("rerun")
+        return control(*args, **kwargs)
+    wrapper._perf = True
+    return wrapper
+
+
+def _hook_controls():
+    # Instalado só quando alguma sessão liga a medição ou o perfil
+    for name in ("stop", "rerun"):
+        control = getattr(st, name)
+        if not getattr(control, "_perf", False):
+            setattr(st, name, _closing(control))
+
+
+def begin():
+    # Início do rerun. Se o anterior terminou por erro, não passou pelo
+    # finish(): fecha aqui, marcado como interrompido.
+    _close("erro")
+    if _enabled(setting("perf", False)):
+        _hook_controls()
+        _local.recorder = Recorder(_session_id())
+    if st.query_params.get("profile") == "1" and _enabled(setting("profile", True)):
+        _hook_controls()
+        _start_profile()
+
+
+def finish():
+    _close("ok")
+    profile_summary()
+
+
+def measured(name):
+    # Para funções @st.fragment: quando o fragmento roda sozinho (sem o
+    # script inteiro), begin()/finish() ficam por conta dele
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "recorder", None) is not None or getattr(_local, "profiler", None) is not None:
+                return fn(*args, **kwargs)  # dentro de um rerun já medido
+            begin()
+            tag(fragmento=name)
+            result = fn(*args, **kwargs)
+            finish()
+            return result
+        return wrapper
+    return decorator
+
+
+# --- Perfil sob demanda (?profile=1 na URL) ---
+# Cada rerun da sessão é perfilado com cProfile; o .prof vai para profile_dir
+# (abre com pstats, snakeviz etc.) e o resumo das funções mais pesadas
+# aparece no fim da página.
+
+def _start_profile():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: um perfil por vez no processo
+        st.warning("Outro perfil está em andamento neste servidor; tente de novo em instantes.")
+        return
+    _local.profiler = profiler
+    _local.profile_tag = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+
+def _close_profile():
+    profiler = getattr(_local, "profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    _local.profiler = None
+    directory = setting("profile_dir", "perfis")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{_session_id()}-{_local.profile_tag}.prof")
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(path)
+    top = int(setting("profile_top", PROFILE_TOP))
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    st.session_state["_perf_perfil"] = {
+        "arquivo": path,
+        "total": stats.total_tt,
+        "funcoes": [
+            {
+                "função": name if file == "~" else f"{os.path.basename(file)}:{line} {name}",
+                "chamadas": calls,
+                "própria (ms)": round(own * 1000, 1),
+                "acumulada (ms)": round(cumulative * 1000, 1),
+            }
+            for (file, line, name), (_, calls, own, cumulative, _) in rows
+        ],
+    }
+
+
+def profile_summary():
+    # Último perfil desta sessão (o do rerun atual, se ele chegou ao fim)
+    perfil = st.session_state.get("_perf_perfil")
+    if perfil is None or st.query_params.get("profile") != "1":
+        return
+    with st.expander(f"🔬 Perfil: {perfil['total'] * 1000:.0f} ms", expanded=True):
+        st.caption(f"Arquivo completo: {perfil['arquivo']}")
+        st.dataframe(perfil["funcoes"], hide_index=True)
+
+
+def panel(counters=None):
+    # Painel da barra lateral com os reruns anteriores desta sessão.
+    # counters: {nome: valor} do processo (cache, API), mostrados no topo
+    if getattr(_local, "recorder", None) is None:
+        return
+    history = st.session_state.get("_perf_historico", [])
+    with st.sidebar.expander("⏱️ Desempenho"):
+        if counters:
+            st.caption(" · ".join(f"{name}: {value}" for name, value in counters.items()))
+        if not history:
+            st.caption("Sem medições ainda.")
+            return
+        last = history[-1]
+        st.caption(f"Último rerun: {last['total'] * 1000:.0f} ms ({last.get('pagina', '')})")
+        names = sorted({n for r in history for n in r["spans"]})
+        st.dataframe(
+            [{
+                "trecho": n,
+                "último (ms)": round(last["spans"].get(n, 0) * 1000, 1),
+                "média (ms)": round(sum(r["spans"].get(n, 0) for r in history) / len(history) * 1000, 1),
+            } for n in names],
+            hide_index=True,
+        )
@@ -0,0 +1,186 @@
+import functools
+import re
+
+import pandas as pd
+
+WORKSHEET = "NACIONALIDADE"
+
+# Colunas da aba, já padronizadas
+COLUMNS = [
+    'ID', 'NUMERO_DO_PROCESSO', 'REQUERENTE', 'CLIENTE', 'E_MAIL', 'ANIVERSARIO',
+    'ARTIGO', 'STATUS', 'VALOR_HONORARIOS', 'VALOR_PAGO', 'SALDO_DEVEDOR', 'OBSERVACOES',
+    'VERSAO',
+]
+# Colunas que o app não grava: planilhas antigas sem VERSAO ficam sem
+# controle de concorrência; NUMERO_DO_PROCESSO só aparece se existir
+OPTIONAL_COLUMNS = ['NUMERO_DO_PROCESSO', 'VERSAO']
+
+# Colunas financeiras tratadas como número
+FINANCIAL_COLUMNS = ['VALOR_HONORARIOS', 'VALOR_PAGO', 'SALDO_DEVEDOR']
+
+# Valores aceitos pelos formulários (e pela edição em massa)
+STATUS_OPTIONS = ["SUBMETIDO", "EM ANÁLISE", "DILIGÊNCIA", "DECISÃO", "CONCLUÍDO"]
+ARTIGO_OPTIONS = ["Neto", "Filho", "Casamento", "Outros"]
+
+# Projeções: cada página carrega só as colunas que usa. ID e REQUERENTE
+# vão sempre (chave do registro e filtro das linhas válidas); os textos
+# longos ficam fora e são lidos por registro, quando o formulário abre.
+WIDE_COLUMNS = ['OBSERVACOES']
+DASHBOARD_COLUMNS = ['ID', 'REQUERENTE', 'ARTIGO', 'STATUS', *FINANCIAL_COLUMNS]
+RECORD_COLUMNS = [c for c in COLUMNS if c not in WIDE_COLUMNS]
+
+# Tipos em memória. Os dados ficam num único DataFrame por processo,
+# compartilhado entre as sessões, então vale guardá-los compactos:
+# poucos valores distintos viram categoria, a data vira datetime e os
+# valores em R$ viram centavos inteiros (soma exata, sem float).
+CATEGORY_COLUMNS = ['STATUS', 'ARTIGO']
+DATE_COLUMNS = ['ANIVERSARIO']
+DATE_FORMAT = '%d/%m/%Y'  # como a data é gravada na planilha
+CENTS = 100
+
+
+# PADRONIZAÇÃO DE COLUNAS: maiúsculas, sem acento, separadores viram "_"
+_FOLD = str.maketrans({
+    **dict(zip("ÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ", "AAAAAEEEEIIIIOOOOOUUUUCN")),
+    **{sep: "_" for sep in " -/.\t\n"},
+})
+_UNDERSCORES = re.compile("_{2,}")
+
+# Linhas examinadas atrás do cabeçalho quando a aba tem título em cima
+HEADER_SCAN = 5
+
+
+class SchemaError(Exception):
+    # As colunas da aba não são as que o app conhece
+    pass
+
+
+@functools.lru_cache(maxsize=64)
+def _canonical(raw):
+    # raw: tupla com o cabeçalho lido; o mesmo cabeçalho não é refeito
+    return tuple(_UNDERSCORES.sub("_", str(c).strip().upper().translate(_FOLD)).strip("_") for c in raw)
+
+
+def normalize_columns(columns):
+    return list(_canonical(tuple(str(c) for c in columns)))
+
+
+def is_header(values):
+    columns = _canonical(tuple(str(c) for c in values))
+    return 'ID' in columns and 'REQUERENTE' in columns
+
+
+def promote_header(data):
+    # Algumas cópias da planilha têm uma linha de título ("CONTROLE ...")
+    # acima do cabeçalho: usa como cabeçalho a primeira linha que o pareça
+    if is_header(data.columns):
+        return data
+    for i, values in enumerate(data.iloc[:HEADER_SCAN].itertuples(index=False)):
+        if is_header(values):
+            data = data.iloc[i + 1:].reset_index(drop=True)
+            data.columns = list(values)
+            return data
+    return data
+
+
+def check_columns(raw, expected=COLUMNS):
+    # Falha logo, com a diferença, em vez de um KeyError no meio da página
+    columns = normalize_columns(raw)
+    missing = [c for c in expected if c not in columns and c not in OPTIONAL_COLUMNS]
+    repeated = sorted({c for c in columns if columns.count(c) > 1})
+    if missing or repeated:
+        unknown = [f"{r!r} -> {c}" for r, c in zip(raw, columns) if c not in COLUMNS]
+        raise SchemaError(
+            "As colunas da aba mudaram."
+            + (f" Faltando: {', '.join(missing)}." if missing else "")
+            + (f" Repetidas: {', '.join(repeated)}." if repeated else "")
+            + (f" Não reconhecidas: {', '.join(unknown)}." if unknown else "")
+        )
+    return columns
+
+
+def to_cents(values):
+    # R$ (número ou texto) -> centavos; vazio ou inválido conta como zero
+    reais = pd.to_numeric(values, errors='coerce').fillna(0)
+    return (reais * CENTS).round().astype('Int64')
+
+
+def reais(cents):
+    # Centavos (um valor) -> R$ para exibir ou gravar
+    return 0.0 if pd.isna(cents) else int(cents) / CENTS
+
+
+def _typed(col, values):
+    if col == 'ID':
+        ids = pd.to_numeric(values, errors='coerce')
+        # ID fracionário não é um ID válido: fica vazio
+        return ids.where(ids == ids.round()).astype('Int64')
+    if col == 'VERSAO':
+        # Versão do registro para o controle de concorrência (sem carimbo = 0)
+        return pd.to_numeric(values, errors='coerce').fillna(0).astype(int)
+    if col in FINANCIAL_COLUMNS:
+        return to_cents(values)
+    if col in CATEGORY_COLUMNS:
+        return values.astype('string').str.strip().astype('category')
+    if col in DATE_COLUMNS:
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values
+        return pd.to_datetime(values.astype('string'), format=DATE_FORMAT, errors='coerce')
+    return values.astype('string')
+
+
+def apply_types(data):
+    for col in data.columns:
+        data[col] = _typed(col, data[col])
+    return data
+
+
+def normalize(data, columns=None):
+    # Mesma limpeza que o load_data() fazia a cada rerun, já com os tipos.
+    # columns: projeção pedida ao backend (None = aba inteira)
+    data = promote_header(data)
+    data.columns = check_columns(data.columns, columns or COLUMNS)
+    if columns is not None:
+        # Backend que só sabe ler a aba inteira
+        data = data[[c for c in columns if c in data.columns]]
+    data = data.dropna(subset=['REQUERENTE'])
+    return apply_types(data)
+
+
+def new_rows(records, columns):
+    # Linhas novas (nomes de coluna já padronizados) no formato em memória;
+    # o que faltar fica vazio, como na releitura da aba
+    return apply_types(pd.DataFrame(records, columns=columns))
+
+
+def set_values(data, mask, fields):
+    # Grava nas linhas da máscara campos vindos do formulário (R$, data
+    # dd/mm/aaaa, texto), convertidos para os tipos em memória
+    row = apply_types(pd.DataFrame([fields]))
+    for col in fields:
+        if col not in data.columns:
+            # Fora da projeção desta cópia
+            continue
+        val = row[col].iloc[0]
+        if isinstance(data[col].dtype, pd.CategoricalDtype):
+            if not pd.isna(val) and val not in data[col].cat.categories:
+                data[col] = data[col].cat.add_categories([val])
+        try:
+            data.loc[mask, col] = val
+        except (TypeError, ValueError):
+            # Coluna criada por outro caminho com tipo incompatível
+            data[col] = data[col].astype(object)
+            data.loc[mask, col] = val
+    return data
+
+
+def concat(data, rows):
+    # Junta linhas novas mantendo as categorias (pd.concat com categorias
+    # diferentes devolveria a coluna como texto)
+    for col in CATEGORY_COLUMNS:
+        if col in data.columns and col in rows.columns:
+            new = rows[col].cat.categories.difference(data[col].cat.categories)
+            if len(new):
+                data = data.assign(**{col: data[col].cat.add_categories(list(new))})
+            rows = rows.assign(**{col: rows[col].cat.set_categories(data[col].cat.categories)})
+    return pd.concat([data, rows], ignore_index=True)
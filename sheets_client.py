@@ -0,0 +1,142 @@
+import contextlib
+import random
+import threading
+import time
+
+# Códigos que valem nova tentativa: cota estourada e erros temporários do Google
+RETRYABLE = {429, 500, 502, 503, 504}
+
+
+class ThrottledError(Exception):
+    # Sem orçamento de requisições (local ou do Google) para atender agora
+    pass
+
+
+def _status(exc):
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _retryable(kind, exc):
+    if kind == "append":
+        # Inclusões não são idempotentes: um 5xx pode ter gravado a linha.
+        # Só o 429 (recusada antes de executar) é seguro repetir.
+        return _status(exc) == 429
+    if _status(exc) in RETRYABLE:
+        return True
+    try:
+        import requests
+    except ImportError:
+        return False
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class TokenBucket:
+    # Orçamento de requisições por minuto, com rajada de até `burst`
+
+    def __init__(self, per_minute, burst=None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.tokens = float(self.capacity)
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        # Consome uma ficha; devolve quantos segundos esperar por ela (0 = já)
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def cancel(self):
+        with self._lock:
+            self.tokens += 1
+
+
+class SheetsClient:
+    # Intermediário de todas as chamadas à API do Google (Sheets e Drive):
+    # respeita o orçamento por minuto de cada tipo de chamada, repete erros
+    # 429/5xx com espera exponencial aleatorizada e conta o que aconteceu.
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, drive_per_minute=600,
+                 max_retries=5, base_delay=1.0, max_delay=32.0, max_wait=10.0, sleep=time.sleep):
+        self.buckets = {
+            "read": TokenBucket(reads_per_minute),
+            "write": TokenBucket(writes_per_minute),
+            "drive": TokenBucket(drive_per_minute),
+        }
+        self.buckets["append"] = self.buckets["write"]
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._local = threading.local()  # no_wait() vale só para a thread que chamou
+        self.counters = {"requests": 0, "retried": 0, "throttled": 0, "failed": 0}
+
+    @contextlib.contextmanager
+    def no_wait(self):
+        # Para quem tem o que servir no lugar (cache com dados antigos): sem
+        # ficha na hora ou com 429/5xx, sobe ThrottledError sem dormir
+        previous = getattr(self._local, "no_wait", False)
+        self._local.no_wait = True
+        try:
+            yield
+        finally:
+            self._local.no_wait = previous
+
+    def _waiting(self):
+        return not getattr(self._local, "no_wait", False)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _acquire(self, kind):
+        bucket = self.buckets[kind]
+        wait = bucket.reserve()
+        if wait > (self.max_wait if self._waiting() else 0):
+            # Esperar tanto travaria o rerun: melhor avisar quem chamou
+            bucket.cancel()
+            self._count("throttled")
+            raise ThrottledError(f"Orçamento de requisições '{kind}' esgotado; tente em {wait:.0f}s")
+        if wait:
+            self._sleep(wait)
+
+    def call(self, kind, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            self._acquire(kind)
+            self._count("requests")
+            try:
+                return fn(*args, **kwargs)
+            except Exception as exc:
+                if not _retryable(kind, exc):
+                    self._count("failed")
+                    raise
+                if not self._waiting():
+                    self._count("failed")
+                    self._count("throttled")
+                    raise ThrottledError("Google Sheets sem resposta agora (sem nova tentativa)") from exc
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    if _status(exc) == 429:
+                        self._count("throttled")
+                        raise ThrottledError("Cota do Google Sheets excedida") from exc
+                    raise
+                # Espera exponencial com jitter total (0 .. base * 2^tentativa)
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                self._count("retried")
+                self._sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
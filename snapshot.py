@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Chave dos metadados do Parquet onde vai a revisão dos dados
+META_KEY = b"nacionalidade"
+
+
+class Snapshots:
+    # Cópia local (Parquet, zstd) de cada versão normalizada dos dados, para
+    # o processo recém-iniciado servir a primeira página sem esperar o Sheets.
+    # A gravação é feita por uma thread e só a versão mais recente de cada
+    # chave é escrita; o arquivo é trocado de uma vez (os.replace).
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.saved = 0
+        self.loaded = 0
+        self._latest = {}  # chave -> Dataset ainda não gravado
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="snapshots", daemon=True)
+        self._thread.start()
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{digest}.parquet")
+
+    def load(self, key):
+        # Devolve (DataFrame, revisão) ou None se não houver cópia desta chave
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = pq.read_table(path, memory_map=True)
+            meta = json.loads(table.schema.metadata[META_KEY])
+            if meta["key"] != repr(key):
+                return None
+            data = table.to_pandas()
+        except Exception:
+            logger.exception("Cópia local ilegível: %s", path)
+            return None
+        self.loaded += 1
+        return data, meta["revision"]
+
+    def schedule(self, key, entry):
+        with self._lock:
+            self._latest[key] = entry
+        self._wake.set()
+
+    def _write(self, key, entry):
+        table = pa.Table.from_pandas(entry.data)
+        meta = {"key": repr(key), "revision": entry.revision, "version": entry.version}
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}), META_KEY: json.dumps(meta, default=str).encode("utf-8"),
+        })
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+        self.saved += 1
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                pending, self._latest = self._latest, {}
+            for key, entry in pending.items():
+                try:
+                    self._write(key, entry)
+                except Exception:
+                    # Ex.: coluna com tipos misturados que o Parquet não aceita
+                    logger.exception("Não foi possível gravar a cópia local de %s", key)
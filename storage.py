@@ -0,0 +1,755 @@
+import contextlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import rowcol_to_a1
+
+from schema import COLUMNS, FINANCIAL_COLUMNS, HEADER_SCAN, WORKSHEET, is_header, normalize, normalize_columns
+from sheets_client import SheetsClient
+
+
+def setting(name, default=None):
+    # Configuração: variável de ambiente NACIONALIDADE_<NOME> ou a seção
+    # [nacionalidade] do .streamlit/secrets.toml
+    env = os.environ.get(f"NACIONALIDADE_{name.upper()}")
+    if env is not None:
+        return env
+    try:
+        return st.secrets.get("nacionalidade", {}).get(name, default)
+    except Exception:
+        # Sem secrets.toml (testes, execução local)
+        return default
+
+
+def _cell(val):
+    # Converte para algo que a API do Sheets aceita (sem NaN / tipos numpy)
+    if val is None:
+        return ""
+    if hasattr(val, "item"):
+        val = val.item()
+    if isinstance(val, float) and math.isnan(val):
+        return ""
+    return val
+
+
+# Leituras de células como o conn.read (gspread_dataframe): números sem a
+# formatação da planilha ("1.500,00", "R$ 1.500,00" numa aba pt-BR) e datas
+# como texto
+_RENDER = {"value_render_option": "UNFORMATTED_VALUE", "date_time_render_option": "FORMATTED_STRING"}
+
+
+def _letter(col):
+    # Número da coluna (1 = A) -> letra(s) da coluna
+    return re.sub(r"\d", "", rowcol_to_a1(1, col))
+
+
+def _same_id(raw, record_id):
+    try:
+        return float(raw) == float(record_id)
+    except (TypeError, ValueError):
+        return False
+
+
+class ConflictError(Exception):
+    # O registro mudou (ou sumiu) depois de lido: current traz a versão
+    # atual no backend (None se foi excluído)
+    def __init__(self, record_id, current):
+        super().__init__(f"Registro ID {record_id} foi alterado por outro usuário")
+        self.record_id = record_id
+        self.current = current
+
+
+def _version(val):
+    try:
+        return int(float(val))
+    except (TypeError, ValueError):
+        return 0
+
+
+class Storage:
+    # Interface comum dos backends. Consultas (busca, agregados) são feitas
+    # sobre o DataFrame em cache, não aqui.
+    name = None
+
+    def revision(self):
+        # Marcador que muda a cada gravação; None = backend sem metadados
+        return None
+
+    def no_wait(self):
+        # Chamadas dentro deste bloco não esperam cota nem repetem falhas:
+        # sobe ThrottledError na hora (backends com cota, como o Sheets)
+        return contextlib.nullcontext()
+
+    # columns: projeção (nomes padronizados); None = todas as colunas
+    def read(self, columns=None):
+        raise NotImplementedError
+
+    def read_record(self, record_id, columns):
+        # Campos de um único registro, lidos na hora (colunas fora da projeção)
+        raise NotImplementedError
+
+    def append_row(self, record):
+        raise NotImplementedError
+
+    # expected_version: VERSAO lida junto com o registro. Se no backend ela
+    # for outra, a gravação não acontece e sobe ConflictError.
+    # update_row devolve a nova VERSAO.
+    def update_row(self, record_id, fields, expected_version=None):
+        raise NotImplementedError
+
+    def delete_row(self, record_id, expected_version=None):
+        raise NotImplementedError
+
+    def next_id(self):
+        # Próximo ID da sequência persistida (atômico, sem varrer os dados)
+        raise NotImplementedError
+
+    def next_ids(self, count):
+        # Bloco de IDs seguidos para uma importação
+        return [self.next_id() for _ in range(count)]
+
+    def apply_batch(self, ops):
+        # Aplica uma lista de operações ({'op': 'append'|'update'|'delete', ...})
+        # e devolve [(posição, erro)] das que foram recusadas. 'bump' (padrão
+        # 1): quanto a operação soma à VERSAO (append: a VERSAO inicial);
+        # vem do write-behind, que junta várias gravações numa só. Esta
+        # versão genérica grava uma a uma e ignora bump.
+        failures = []
+        for i, op in enumerate(ops):
+            try:
+                if op['op'] == 'append':
+                    self.append_row(op['record'])
+                elif op['op'] == 'update':
+                    self.update_row(op['id'], op['fields'], op.get('expected_version'))
+                elif op['op'] == 'delete':
+                    self.delete_row(op['id'], op.get('expected_version'))
+            except (KeyError, ConflictError) as e:
+                failures.append((i, e))
+        return failures
+
+    def pending(self):
+        # Operações aceitas mas ainda não gravadas no backend (write-behind)
+        return []
+
+    def queue_status(self):
+        return None
+
+    def api_stats(self):
+        # Contadores do cliente da API (SheetsClient.stats); None sem cota
+        return None
+
+
+class SheetsStorage(Storage):
+    # Gravação linha a linha na aba: cada operação toca só as células da
+    # linha afetada em vez de regravar a planilha inteira com conn.update.
+
+    # Aba auxiliar da sequência de IDs. A linha 1 guarda a base (maior ID
+    # existente quando a aba foi criada); cada ID novo é um append e o número
+    # da linha devolvido pelo Sheets define o ID. O append é serializado pelo
+    # próprio Google, então dois usuários nunca recebem o mesmo número.
+    SEQUENCE_WORKSHEET = "SEQUENCIA_ID"
+
+    def __init__(self, conn, worksheet=WORKSHEET, client=None):
+        self.name = f"gsheets:{worksheet}"
+        self._conn = conn
+        # Toda chamada à API passa pelo cliente (cota por minuto + novas tentativas)
+        self.client = client or SheetsClient()
+        self._worksheet_name = worksheet
+        self._spreadsheet = None
+        self._worksheet = None
+        self._lock = threading.Lock()
+        self._columns = None  # colunas padronizadas, na ordem da planilha
+        self._header_row = 1
+        self._revision = None  # última revisão conferida (revision())
+        self._header_revision = None  # revisão em que o cabeçalho foi conferido
+        self._rows = {}  # ID -> número da linha na planilha
+        self._sequence = None
+        self._sequence_base = None
+
+    def _service_account(self):
+        # Só a conta de serviço tem acesso à API (metadados do Drive, células);
+        # planilha pública é só leitura, e inteira
+        return hasattr(self._conn.client, "_open_spreadsheet")
+
+    def no_wait(self):
+        return self.client.no_wait()
+
+    def api_stats(self):
+        return self.client.stats()
+
+    def revision(self):
+        if not self._service_account():
+            return None
+        self._revision = self._api("drive", self._spreadsheet_handle().get_lastUpdateTime)
+        return self._revision
+
+    def read(self, columns=None):
+        # Planilha pública: a projeção fica para a normalização
+        if columns is None or not self._service_account():
+            return self._api("read", self._conn.read, worksheet=self._worksheet_name, ttl=0)
+        # Só as colunas pedidas: uma faixa por coluna num único batch_get,
+        # cada uma devolvida como lista (major_dimension=COLUMNS). A faixa
+        # começa no cabeçalho: se a célula de cima não é mais a coluna
+        # esperada (coluna inserida ou movida), relê o cabeçalho e a faixa.
+        for attempt in range(2):
+            header = self._header()
+            present = [c for c in columns if c in header]
+            ranges = [f"{_letter(header.index(col) + 1)}{self._header_row}:{_letter(header.index(col) + 1)}"
+                      for col in present]
+            values = self._api(
+                "read", self._ws().batch_get, ranges, major_dimension="COLUMNS", **_RENDER,
+            ) if ranges else []
+            values = [v[0] if v else [] for v in values]
+            if normalize_columns([v[0] if v else "" for v in values]) == present or attempt:
+                break
+            self._reset_header()
+        values = [v[1:] for v in values]
+        # O Sheets corta as células vazias do fim de cada coluna
+        length = max((len(v) for v in values), default=0)
+        return pd.DataFrame({
+            col: [x if x != "" else None for x in v] + [None] * (length - len(v))
+            for col, v in zip(present, values)
+        }, columns=present)
+
+    def read_record(self, record_id, columns):
+        if not self._service_account():
+            data = normalize(self.read())
+            row = data[data['ID'].eq(record_id).fillna(False).astype(bool)]
+            if row.empty:
+                raise KeyError(f"Registro ID {record_id} não encontrado na planilha")
+            return row.iloc[0][columns].to_dict()
+        with self._lock:
+            _, current = self._find_row(record_id)
+        return {c: current.get(c) for c in columns}
+
+    def _api(self, kind, fn, *args, **kwargs):
+        return self.client.call(kind, fn, *args, **kwargs)
+
+    def _ws(self):
+        if self._worksheet is None:
+            self._worksheet = self._api("read", self._conn.client._select_worksheet, worksheet=self._worksheet_name)
+        return self._worksheet
+
+    def _spreadsheet_handle(self):
+        if self._spreadsheet is None:
+            self._spreadsheet = self._api("read", self._conn.client._open_spreadsheet)
+        return self._spreadsheet
+
+    def _header(self):
+        if self._columns is None:
+            # Normalmente a linha 1; abas com título em cima têm o cabeçalho mais abaixo
+            first = values = self._api("read", self._ws().row_values, 1)
+            row = 1
+            while not is_header(values) and row <= HEADER_SCAN:
+                row += 1
+                values = self._api("read", self._ws().row_values, row)
+            if not is_header(values):
+                values, row = first, 1
+            self._columns = normalize_columns(values)
+            self._header_row = row
+            self._header_revision = self._revision
+        return self._columns
+
+    def _reset_header(self):
+        # Cabeçalho mudou na planilha: as letras das colunas e o mapa de
+        # linhas guardados não valem mais
+        self._columns = None
+        self._rows = {}
+
+    def _stale_header(self, raw):
+        # raw: linha do cabeçalho lida agora, junto com os dados. Diferente da
+        # guardada: esquece o cabeçalho para quem chamou relê-lo
+        raw = list(raw)
+        while raw and raw[-1] in ("", None):
+            raw.pop()
+        if normalize_columns(raw) == self._columns:
+            self._header_revision = self._revision
+            return False
+        self._reset_header()
+        return True
+
+    def _check_header(self):
+        # Antes de gravar uma linha inteira (append) na ordem do cabeçalho:
+        # relê a linha do cabeçalho se a planilha mudou desde a conferência
+        self._header()
+        if self._revision is not None and self._revision == self._header_revision:
+            return
+        raw = self._api("read", self._ws().row_values, self._header_row)
+        if self._stale_header(raw):
+            self._header()
+
+    def _column(self, name):
+        try:
+            return self._header().index(name) + 1
+        except ValueError:
+            raise KeyError(f"Coluna '{name}' não existe na aba {self._worksheet_name}")
+
+    def _load_rows(self, check=True):
+        # Lê só a coluna ID para mapear ID -> linha, junto com a linha do
+        # cabeçalho (a coluna ID pode ter mudado de lugar)
+        letter = _letter(self._column('ID'))
+        head, ids = self._api(
+            "read", self._ws().batch_get,
+            [f"{self._header_row}:{self._header_row}", f"{letter}{self._header_row + 1}:{letter}"], **_RENDER,
+        )
+        if check and self._stale_header(head[0] if head else []):
+            return self._load_rows(check=False)
+        self._rows = {}
+        for row, cells in enumerate(ids, start=self._header_row + 1):
+            try:
+                self._rows.setdefault(float(cells[0]), row)
+            except (IndexError, TypeError, ValueError):
+                continue
+
+    def _read_row(self, row):
+        # A linha e o cabeçalho numa requisição: com o cabeçalho mudado, os
+        # valores são lidos (e gravados depois) pelas colunas atuais
+        self._header()
+        head, values = self._api(
+            "read", self._ws().batch_get, [f"{self._header_row}:{self._header_row}", f"{row}:{row}"], **_RENDER,
+        )
+        self._stale_header(head[0] if head else [])
+        header = self._header()
+        values = values[0] if values else []
+        return dict(zip(header, values + [""] * (len(header) - len(values))))
+
+    def _find_row(self, record_id):
+        # Confere a linha guardada lendo só essa linha; se alguém inseriu ou
+        # excluiu linhas nesse meio tempo, remapeia pela coluna ID.
+        # Devolve (número da linha, valores atuais).
+        row = self._rows.get(float(record_id))
+        if row is not None:
+            current = self._read_row(row)
+            if _same_id(current.get('ID'), record_id):
+                return row, current
+        self._load_rows()
+        row = self._rows.get(float(record_id))
+        if row is None:
+            raise KeyError(f"Registro ID {record_id} não encontrado na planilha")
+        return row, self._read_row(row)
+
+    def _has_id(self, record_id):
+        try:
+            return float(record_id) in self._rows
+        except (TypeError, ValueError):
+            return False
+
+    def _applied(self, op, current):
+        # Update que já está na linha: a VERSAO andou exatamente o que ele soma
+        if op['op'] != 'update' or op.get('expected_version') is None or 'VERSAO' not in self._header():
+            return False
+        return _version(current.get('VERSAO')) == _version(op['expected_version']) + op.get('bump', 1)
+
+    def _check_version(self, record_id, current, expected_version):
+        # Planilhas sem a coluna VERSAO ficam sem controle de concorrência
+        if expected_version is None or 'VERSAO' not in self._header():
+            return
+        if _version(current.get('VERSAO')) != _version(expected_version):
+            raise ConflictError(record_id, current)
+
+    def _sequence_ws(self):
+        if self._sequence is not None:
+            return self._sequence
+        spreadsheet = self._spreadsheet_handle()
+        try:
+            ws = self._api("read", spreadsheet.worksheet, self.SEQUENCE_WORKSHEET)
+        except WorksheetNotFound:
+            # Primeira vez: parte do maior ID já usado na aba principal
+            self._load_rows()
+            base = int(max(self._rows, default=0))
+            try:
+                ws = self._api("write", spreadsheet.add_worksheet, self.SEQUENCE_WORKSHEET, rows=1, cols=2)
+                self._api("write", ws.update, "A1:B1", [["BASE", base]])
+            except APIError:
+                # Outro processo criou a aba ao mesmo tempo
+                ws = self._api("read", spreadsheet.worksheet, self.SEQUENCE_WORKSHEET)
+        self._sequence_base = int(float(self._api("read", ws.acell, "B1").value))
+        self._sequence = ws
+        return ws
+
+    def next_id(self):
+        with self._lock:
+            ws = self._sequence_ws()
+        resp = self._api(
+            "append", ws.append_row, [datetime.now().isoformat(timespec="seconds")],
+            insert_data_option="INSERT_ROWS", table_range="A1",
+        )
+        updated = resp.get("updates", {}).get("updatedRange", "")
+        row = int(re.search(r"![A-Z]+(\d+)", updated).group(1))
+        return self._sequence_base + row - 1
+
+    def next_ids(self, count):
+        # Um único append de count linhas na aba da sequência: as linhas
+        # devolvidas (seguidas) definem o bloco de IDs
+        if count <= 0:
+            return []
+        with self._lock:
+            ws = self._sequence_ws()
+        stamp = datetime.now().isoformat(timespec="seconds")
+        resp = self._api(
+            "append", ws.append_rows, [[stamp]] * count, insert_data_option="INSERT_ROWS", table_range="A1",
+        )
+        updated = resp.get("updates", {}).get("updatedRange", "")
+        first, last = re.search(r"![A-Z]+(\d+)(?::[A-Z]+(\d+))?", updated).groups()
+        first = int(first)
+        if int(last or first) - first + 1 != count:
+            raise RuntimeError(f"Sequência de IDs devolveu {updated} para {count} linhas")
+        return list(range(self._sequence_base + first - 1, self._sequence_base + first - 1 + count))
+
+    def append_row(self, record):
+        with self._lock:
+            record = {**record, 'VERSAO': 1}
+            self._check_header()
+            values = [_cell(record.get(col, "")) for col in self._header()]
+            resp = self._api(
+                "append", self._ws().append_row, values, value_input_option="USER_ENTERED",
+                insert_data_option="INSERT_ROWS", table_range="A1",
+            )
+            # Ex.: "NACIONALIDADE!A57:K57" -> linha 57
+            updated = resp.get("updates", {}).get("updatedRange", "")
+            match = re.search(r"![A-Z]+(\d+)", updated)
+            if match and record.get('ID') is not None:
+                self._rows[float(record['ID'])] = int(match.group(1))
+
+    def update_row(self, record_id, fields, expected_version=None):
+        # Entre a conferência da versão e a gravação há uma janela de uma
+        # requisição; o Sheets não oferece gravação condicional.
+        with self._lock:
+            row, current = self._find_row(record_id)
+            self._check_version(record_id, current, expected_version)
+            version = _version(current.get('VERSAO')) + 1
+            if 'VERSAO' in self._header():
+                fields = {**fields, 'VERSAO': version}
+            # Um único batch_update com apenas as células alteradas
+            data = [
+                {"range": rowcol_to_a1(row, self._column(col)), "values": [[_cell(val)]]}
+                for col, val in fields.items()
+            ]
+            self._api("write", self._ws().batch_update, data, value_input_option="USER_ENTERED")
+            return version
+
+    def delete_row(self, record_id, expected_version=None):
+        with self._lock:
+            row, current = self._find_row(record_id)
+            self._check_version(record_id, current, expected_version)
+            self._api("write", self._ws().delete_rows, row)
+            # As linhas abaixo sobem uma posição
+            del self._rows[float(record_id)]
+            self._rows = {k: (r - 1 if r > row else r) for k, r in self._rows.items()}
+
+    def apply_batch(self, ops):
+        # Lote inteiro em poucas requisições: uma leitura da coluna ID, um
+        # append_rows, uma leitura das linhas afetadas (conferência de versão),
+        # um batch_update de células e um batch_update de exclusões.
+        # Pode ser repetido depois de falhar no meio (o write-behind reenvia o
+        # lote): inclusão cujo ID já está na aba e update cuja linha já mostra
+        # expected_version + bump contam como gravados, não como de novo.
+        failures = []
+        with self._lock:
+            targets = [(i, op) for i, op in enumerate(ops) if op['op'] in ('update', 'delete')]
+            appends = [op for op in ops if op['op'] == 'append']
+            if not targets and not appends:
+                return failures
+            # Confere também o cabeçalho: as letras abaixo saem dele
+            self._load_rows()
+            header = self._header()
+            appends = [op for op in appends if not self._has_id(op['record'].get('ID'))]
+            if appends:
+                resp = self._api(
+                    "append", self._ws().append_rows,
+                    [[_cell({**op['record'], 'VERSAO': op.get('bump', 1)}.get(col, "")) for col in header]
+                     for op in appends],
+                    value_input_option="USER_ENTERED", insert_data_option="INSERT_ROWS", table_range="A1",
+                )
+                # Linhas novas entram no mapa (updates do mesmo lote sobre elas)
+                updated = resp.get("updates", {}).get("updatedRange", "")
+                match = re.search(r"![A-Z]+(\d+)", updated)
+                if match:
+                    for row, op in enumerate(appends, start=int(match.group(1))):
+                        if op['record'].get('ID') is not None:
+                            self._rows.setdefault(float(op['record']['ID']), row)
+
+            if not targets:
+                self._rows = {}
+                return failures
+            located = []
+            for i, op in targets:
+                row = self._rows.get(float(op['id']))
+                if row is None:
+                    failures.append((i, KeyError(f"Registro ID {op['id']} não encontrado na planilha")))
+                else:
+                    located.append((i, op, row))
+            ranges = [f"{rowcol_to_a1(row, 1)}:{rowcol_to_a1(row, len(header))}" for _, _, row in located]
+            current_rows = self._api("read", self._ws().batch_get, ranges, **_RENDER) if ranges else []
+
+            cells, deleted = [], []
+            seen = {}  # linha -> valores depois das operações anteriores do lote
+            for (i, op, row), values in zip(located, current_rows):
+                if row in deleted:
+                    failures.append((i, ConflictError(op['id'], None)))
+                    continue
+                current = seen.get(row)
+                if current is None:
+                    values = values[0] if values else []
+                    current = dict(zip(header, values + [""] * (len(header) - len(values))))
+                    if self._applied(op, current):
+                        # Já gravado por um envio anterior que falhou depois
+                        seen[row] = current
+                        continue
+                try:
+                    self._check_version(op['id'], current, op.get('expected_version'))
+                except ConflictError as e:
+                    failures.append((i, e))
+                    continue
+                if op['op'] == 'delete':
+                    deleted.append(row)
+                    continue
+                fields = dict(op['fields'])
+                if 'VERSAO' in header:
+                    fields['VERSAO'] = _version(current.get('VERSAO')) + op.get('bump', 1)
+                # O próximo op do mesmo registro neste lote confere contra esta versão
+                seen[row] = {**current, **fields}
+                cells += [
+                    {"range": rowcol_to_a1(row, self._column(col)), "values": [[_cell(val)]]}
+                    for col, val in fields.items()
+                ]
+            if cells:
+                self._api("write", self._ws().batch_update, cells, value_input_option="USER_ENTERED")
+            if deleted:
+                # De baixo para cima, para os números das linhas não mudarem
+                sheet_id = self._ws().id
+                self._api("write", self._spreadsheet_handle().batch_update, {"requests": [
+                    {"deleteDimension": {"range": {
+                        "sheetId": sheet_id, "dimension": "ROWS", "startIndex": row - 1, "endIndex": row,
+                    }}}
+                    for row in sorted(deleted, reverse=True)
+                ]})
+            self._rows = {}
+        return failures
+
+
+def _sql_type(column):
+    if column == 'ID':
+        return "INTEGER PRIMARY KEY"
+    if column == 'VERSAO':
+        return "INTEGER"
+    if column in FINANCIAL_COLUMNS:
+        return "REAL"
+    return "TEXT"
+
+
+class SQLiteStorage(Storage):
+    # Banco local. Serve para rodar sem o Google Sheets (testes, uso
+    # offline) e como caminho de migração. Como no Sheets, o banco só é lido
+    # inteiro (por revisão) e por ID: buscas, filtros e agregados rodam no
+    # cache em memória, com os índices de lá (indexes, grid, aggregates).
+    TABLE = "nacionalidade"
+
+    def __init__(self, path):
+        self.name = f"sqlite:{path}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        cols = ", ".join(f'"{c}" {_sql_type(c)}' for c in COLUMNS)
+        with self._db:
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({cols})")
+            # Bancos criados antes de colunas novas (ex.: VERSAO)
+            existing = {r[1] for r in self._db.execute(f"PRAGMA table_info({self.TABLE})")}
+            for c in COLUMNS:
+                if c not in existing:
+                    self._db.execute(f'ALTER TABLE {self.TABLE} ADD COLUMN "{c}" {_sql_type(c)}')
+            # Índices de versões anteriores: nenhuma consulta os usa, só
+            # deixavam as gravações mais lentas
+            for col in ['REQUERENTE', 'STATUS', 'ARTIGO']:
+                self._db.execute(f"DROP INDEX IF EXISTS idx_{col.lower()}")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor INTEGER)")
+            self._db.execute("INSERT OR IGNORE INTO meta VALUES ('revisao', 0)")
+            self._db.execute(
+                f"INSERT OR IGNORE INTO meta SELECT 'ultimo_id', COALESCE(MAX(ID), 0) FROM {self.TABLE}"
+            )
+
+    def _check_columns(self, names):
+        unknown = [c for c in names if c not in COLUMNS]
+        if unknown:
+            raise KeyError(f"Colunas desconhecidas: {unknown}")
+
+    def _bump(self):
+        self._db.execute("UPDATE meta SET valor = valor + 1 WHERE chave = 'revisao'")
+
+    def revision(self):
+        with self._lock:
+            return self._db.execute("SELECT valor FROM meta WHERE chave = 'revisao'").fetchone()[0]
+
+    def read(self, columns=None):
+        if columns is None:
+            select = "*"
+        else:
+            self._check_columns(columns)
+            select = ", ".join(f'"{c}"' for c in columns)
+        with self._lock:
+            return pd.read_sql_query(f"SELECT {select} FROM {self.TABLE} ORDER BY ID", self._db)
+
+    def read_record(self, record_id, columns):
+        with self._lock:
+            current = self._current(record_id)
+        if current is None:
+            raise KeyError(f"Registro ID {record_id} não encontrado")
+        return {c: current.get(c) for c in columns}
+
+    def next_id(self):
+        # UPDATE ... RETURNING é atômico inclusive entre processos
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE meta SET valor = valor + 1 WHERE chave = 'ultimo_id' RETURNING valor"
+            ).fetchone()[0]
+
+    def next_ids(self, count):
+        with self._lock, self._db:
+            last = self._db.execute(
+                "UPDATE meta SET valor = valor + ? WHERE chave = 'ultimo_id' RETURNING valor", [count]
+            ).fetchone()[0]
+        return list(range(last - count + 1, last + 1))
+
+    def _current(self, record_id):
+        cur = self._db.execute(f"SELECT * FROM {self.TABLE} WHERE ID = ?", [int(record_id)])
+        row = cur.fetchone()
+        return None if row is None else dict(zip([d[0] for d in cur.description], row))
+
+    def _conflict(self, record_id, expected_version):
+        # Nenhuma linha afetada: registro sumiu ou a versão não confere
+        current = self._current(record_id)
+        if current is None and expected_version is None:
+            raise KeyError(f"Registro ID {record_id} não encontrado")
+        raise ConflictError(record_id, current)
+
+    # _insert/_update/_delete rodam dentro da transação de quem chama
+    def _insert(self, record, version=1):
+        record = {k: _cell(v) for k, v in record.items() if k in COLUMNS}
+        record['VERSAO'] = version
+        cols = ", ".join(f'"{c}"' for c in record)
+        marks = ", ".join("?" for _ in record)
+        self._db.execute(f"INSERT INTO {self.TABLE} ({cols}) VALUES ({marks})", list(record.values()))
+        if record.get('ID') not in (None, ""):
+            # IDs informados de fora (importação) mantêm a sequência à frente
+            self._db.execute(
+                "UPDATE meta SET valor = MAX(valor, ?) WHERE chave = 'ultimo_id'", [int(record['ID'])]
+            )
+
+    def append_row(self, record):
+        with self._lock, self._db:
+            self._insert(record)
+            self._bump()
+
+    def _where(self, record_id, expected_version):
+        # Condição da gravação: mesmo ID e, se informada, a mesma VERSAO
+        if expected_version is None:
+            return "ID = ?", [int(record_id)]
+        return "ID = ? AND COALESCE(VERSAO, 0) = ?", [int(record_id), _version(expected_version)]
+
+    def _update(self, record_id, fields, expected_version, bump=1):
+        fields = {k: v for k, v in fields.items() if k != 'VERSAO'}
+        self._check_columns(fields)
+        sets = ", ".join(f'"{c}" = ?' for c in fields)
+        values = [_cell(v) for v in fields.values()]
+        where, params = self._where(record_id, expected_version)
+        cur = self._db.execute(
+            f"UPDATE {self.TABLE} SET {sets}, VERSAO = COALESCE(VERSAO, 0) + ? WHERE {where} RETURNING VERSAO",
+            values + [bump] + params,
+        )
+        row = cur.fetchone()
+        if row is None:
+            self._conflict(record_id, expected_version)
+        return row[0]
+
+    def update_row(self, record_id, fields, expected_version=None):
+        with self._lock, self._db:
+            version = self._update(record_id, fields, expected_version)
+            self._bump()
+            return version
+
+    def _delete(self, record_id, expected_version):
+        where, params = self._where(record_id, expected_version)
+        cur = self._db.execute(f"DELETE FROM {self.TABLE} WHERE {where}", params)
+        if cur.rowcount == 0:
+            self._conflict(record_id, expected_version)
+
+    def delete_row(self, record_id, expected_version=None):
+        with self._lock, self._db:
+            self._delete(record_id, expected_version)
+            self._bump()
+
+    def apply_batch(self, ops):
+        # O lote inteiro numa transação: um commit só, em vez de um por linha
+        failures = []
+        with self._lock, self._db:
+            for i, op in enumerate(ops):
+                try:
+                    if op['op'] == 'append':
+                        self._insert(op['record'], op.get('bump', 1))
+                    elif op['op'] == 'update':
+                        self._update(op['id'], op['fields'], op.get('expected_version'), op.get('bump', 1))
+                    elif op['op'] == 'delete':
+                        self._delete(op['id'], op.get('expected_version'))
+                except (KeyError, ConflictError) as e:
+                    failures.append((i, e))
+            if len(failures) < len(ops):
+                self._bump()
+        return failures
+
+
+def sheets_client():
+    # Cotas padrão do Google: 60 leituras e 60 gravações por minuto por usuário
+    return SheetsClient(
+        reads_per_minute=int(setting("reads_per_minute", 60)),
+        writes_per_minute=int(setting("writes_per_minute", 60)),
+        max_retries=int(setting("max_retries", 5)),
+    )
+
+
+@st.cache_resource
+def sheets_storage(_conn, worksheet=WORKSHEET):
+    return SheetsStorage(_conn, worksheet, sheets_client())
+
+
+@st.cache_resource
+def sqlite_storage(path):
+    return SQLiteStorage(path)
+
+
+@st.cache_resource
+def write_behind_storage(_inner, name, journal_path, interval):
+    from write_behind import WriteBehindStorage
+
+    return WriteBehindStorage(_inner, journal_path, interval)
+
+
+def _enabled(value):
+    return str(value).strip().lower() in ("1", "true", "sim", "yes")
+
+
+def get_storage():
+    # Backend escolhido por configuração: "gsheets" (padrão) ou "sqlite"
+    backend = setting("backend", "gsheets")
+    if backend == "sqlite":
+        storage = sqlite_storage(setting("sqlite_path", "nacionalidade.db"))
+    elif backend == "gsheets":
+        from streamlit_gsheets import GSheetsConnection
+
+        storage = sheets_storage(st.connection("gsheets", type=GSheetsConnection))
+    else:
+        raise ValueError(f"Backend de armazenamento desconhecido: {backend}")
+
+    # write_behind = true: gravações vão para um diário local e seguem em lote
+    if _enabled(setting("write_behind", False)):
+        storage = write_behind_storage(
+            storage, storage.name,
+            setting("journal_path", "write_behind.db"),
+            float(setting("flush_interval", 2.0)),
+        )
+    return storage
@@ -1,70 +1,271 @@
 import streamlit as st
-from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-import plotly.express as px
 from datetime import datetime
+from aggregates import Aggregates
+from data_cache import dataset, append_row, update_row, update_rows, delete_row, shared_cache
+from exporter import FORMATS as EXPORT_FORMATS, export_data, full_rows, shared_exports
+from grid import EDITABLE_COLUMNS, FILTER_COLUMNS, PAGE_SIZES, TEXT_FILTER_COLUMNS, RecordGrid, bulk_changes
+from importer import MAX_ERRORS, Checkpoint, Importer, file_digest
+from indexes import SEARCH_LIMIT, RecordIndex, SearchIndex
+import perf
+from schema import (
+    ARTIGO_OPTIONS, DASHBOARD_COLUMNS, RECORD_COLUMNS, STATUS_OPTIONS, WIDE_COLUMNS, SchemaError, normalize, reais,
+)
+from sheets_client import ThrottledError
+from storage import ConflictError, get_storage, setting
+import warmup
 
 # Configuração da Página
 st.set_page_config(page_title="Gestão Nacionalidade v3.4", layout="wide")
 
-# Conexão com Google Sheets
-conn = st.connection("gsheets", type=GSheetsConnection)
+# Cronometragem do rerun (configuração perf = true)
+perf.begin()
 
-def load_data():
-    data = conn.read(worksheet="NACIONALIDADE", ttl="0")
-    
-    # PADRONIZAÇÃO DE COLUNAS
-    data.columns = [
-        str(c).strip().upper()
-        .replace(' ', '_').replace('É', 'E').replace('Á', 'A')
-        .replace('Ç', 'C').replace('Õ', 'O').replace('/', '_')
-        for c in data.columns
-    ]
-    
-    if 'ID' in data.columns:
-        data['ID'] = pd.to_numeric(data['ID'], errors='coerce')
-    
-    data = data.dropna(subset=['REQUERENTE'])
-    
-    cols_fin = ['VALOR_HONORARIOS', 'VALOR_PAGO', 'SALDO_DEVEDOR']
-    for col in cols_fin:
-        if col in data.columns:
-            data[col] = pd.to_numeric(data[col], errors='coerce').fillna(0)
-            
-    return data
+# Armazenamento (Google Sheets ou SQLite local, conforme configuração)
+storage = get_storage()
+
+# Primeira sessão do processo: carrega dados, índices e o Plotly em segundo plano
+warmup.start(storage, storage.name, normalize)
+
+AVISO_COTA = "O Google Sheets está limitando as requisições no momento. Aguarde alguns segundos e tente de novo."
+
+def load_data(columns):
+    # Lê do cache do processo; a planilha só é baixada quando muda de revisão,
+    # e só com as colunas que a página usa
+    try:
+        return dataset(storage, normalize=normalize, columns=columns)
+    except ThrottledError:
+        # Primeira leitura sem cota e sem cópia em memória para mostrar
+        st.error(AVISO_COTA)
+        st.stop()
+    except SchemaError as e:
+        # Cabeçalho da planilha alterado: mostra o que mudou em vez de quebrar adiante
+        st.error(str(e))
+        st.stop()
+
+def open_record(ds, idx, id_sel):
+    # Registro como está no cache, mais os textos longos (fora da projeção)
+    # lidos só deste registro; guardados na versão dos dados
+    item = idx.row(ds.data, id_sel).to_dict()
+    extras = ds.derived("textos", lambda data: {})
+    if id_sel not in extras:
+        with perf.span("record"):
+            try:
+                extras[id_sel] = storage.read_record(id_sel, WIDE_COLUMNS)
+            except KeyError:
+                # Excluído no backend: o formulário abre sem os textos
+                extras[id_sel] = {}
+    return {**item, **extras[id_sel]}
 
 def clean_val(val):
     if pd.isna(val) or str(val).lower() == 'nan':
         return ""
     return str(val)
 
-df = load_data()
+def same_val(a, b):
+    # Compara valor do formulário com o da planilha (que pode vir como texto)
+    try:
+        return float(a) == float(b)
+    except (TypeError, ValueError):
+        return clean_val(a).strip() == clean_val(b).strip()
 
-# --- MENU LATERAL ---
-st.sidebar.title("Nacionalidade App")
-menu = st.sidebar.radio("Navegação", ["📊 Dashboard", "➕ Inclusão", "📝 Gerenciar Registros"])
+def show_conflict(conflito):
+    # Tela de mesclagem quando outro usuário gravou o registro antes
+    st.error("Este registro foi alterado por outro usuário depois que você o abriu.")
+    atual = conflito['atual']
+    if atual is None:
+        st.warning("O registro foi excluído por outro usuário.")
+        if st.button("OK"):
+            del st.session_state['conflito']
+            st.rerun()
+        return
 
-# --- DASHBOARD ---
-if menu == "📊 Dashboard":
-    st.header("Resumo Geral")
-    if not df.empty:
-        c1, c2, c3, c4 = st.columns(4)
-        c1.metric("Total Processos", len(df))
-        c2.metric("Concluídos", len(df[df['STATUS'].str.contains('CONCLUÍDO', na=False, case=False)]))
-        c3.metric("Total Recebido", f"R$ {df['VALOR_PAGO'].sum():,.2f}")
-        c4.metric("Saldo Devedor", f"R$ {df['SALDO_DEVEDOR'].sum():,.2f}")
-        
-        st.divider()
-        fig = px.pie(df, names='STATUS', title="Status dos Processos", hole=0.4)
-        st.plotly_chart(fig, use_container_width=True)
+    if conflito['meu'] is None:
+        st.write("Você pediu para excluir o registro. Versão atual:")
+        st.dataframe(pd.DataFrame([atual]), hide_index=True)
+    else:
+        linhas = [
+            {"Campo": campo, "Sua alteração": clean_val(valor), "Versão atual": clean_val(atual.get(campo)),
+             "Diferente": "⚠️" if not same_val(valor, atual.get(campo)) else ""}
+            for campo, valor in conflito['meu'].items()
+        ]
+        st.dataframe(pd.DataFrame(linhas), hide_index=True, width="stretch")
 
-# --- INCLUSÃO ---
-elif menu == "➕ Inclusão":
-    st.header("Novo Cadastro")
-    
-    proximo_id = int(df['ID'].max() + 1) if not df.empty and not pd.isna(df['ID'].max()) else 1
-    st.write(f"ID do Registro: **{proximo_id}**")
-    
+    b1, b2 = st.columns(2)
+    if b1.button("Aplicar a minha versão mesmo assim"):
+        try:
+            if conflito['meu'] is None:
+                delete_row(storage, conflito['id'], expected_version=atual.get('VERSAO'))
+            else:
+                update_row(storage, conflito['id'], conflito['meu'], expected_version=atual.get('VERSAO'))
+            del st.session_state['conflito']
+            st.session_state.pop('aberto', None)
+        except ConflictError as e:
+            # Alterado de novo enquanto decidíamos
+            st.session_state['conflito'] = {**conflito, 'atual': e.current}
+        except ThrottledError:
+            st.error(AVISO_COTA)
+            return
+        st.rerun()
+    if b2.button("Descartar a minha alteração"):
+        del st.session_state['conflito']
+        st.session_state.pop('aberto', None)
+        st.rerun()
+
+# Cada bloco abaixo é um fragmento: interagir com ele reexecuta só a função,
+# sem reler os dados nem redesenhar o resto da página. Gravações que mudam
+# os dados terminam com st.rerun() para atualizar a página inteira.
+
+@st.fragment
+def metrics(agg):
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Total Processos", agg.total)
+    c2.metric("Concluídos", agg.concluidos)
+    c3.metric("Total Recebido", f"R$ {agg.valor_pago:,.2f}")
+    c4.metric("Saldo Devedor", f"R$ {agg.saldo_devedor:,.2f}")
+
+@st.fragment
+def charts(agg):
+    # Gráfico a partir das contagens já agregadas
+    with perf.span("chart"):
+        # Plotly só é carregado por quem abre o Dashboard
+        import plotly.express as px
+        fig = px.pie(names=list(agg.status), values=list(agg.status.values()), title="Status dos Processos", hole=0.4)
+        st.plotly_chart(fig, width="stretch")
+
+# Colunas da tabela da página Registros
+GRID_CONFIG = {
+    'ID': st.column_config.NumberColumn("ID", format="%d"),
+    'NUMERO_DO_PROCESSO': "Nº do Processo",
+    'REQUERENTE': "Requerente",
+    'CLIENTE': "Cliente",
+    'ARTIGO': "Artigo",
+    'STATUS': "Status",
+    'VALOR_HONORARIOS': st.column_config.NumberColumn("Honorários", format="R$ %.2f"),
+    'VALOR_PAGO': st.column_config.NumberColumn("Pago", format="R$ %.2f"),
+    'SALDO_DEVEDOR': st.column_config.NumberColumn("Saldo", format="R$ %.2f"),
+}
+ORDENS = {
+    'REQUERENTE': "Requerente", 'ID': "ID", 'CLIENTE': "Cliente", 'STATUS': "Status",
+    'ARTIGO': "Artigo", 'SALDO_DEVEDOR': "Saldo", 'VALOR_PAGO': "Pago", 'VALOR_HONORARIOS': "Honorários",
+}
+
+@st.fragment
+@perf.measured("registros")
+def records_grid(ds):
+    # Filtro, ordem e paginação rodam aqui, sobre os dados em cache; o
+    # navegador recebe só a página visível
+    with perf.span("grid"):
+        grid = ds.derived("grid", RecordGrid.build)
+    colunas = st.columns(len(FILTER_COLUMNS) + len(TEXT_FILTER_COLUMNS) + 1)
+    filtros = {
+        col: c.multiselect(col.capitalize(), grid.values(col), key=f"filtro_{col}")
+        for c, col in zip(colunas, FILTER_COLUMNS)
+    }
+    # Clientes são muitos: em vez da lista inteira no navegador, o texto digitado
+    for c, col in zip(colunas[len(FILTER_COLUMNS):], TEXT_FILTER_COLUMNS):
+        filtros[col] = c.text_input(col.capitalize(), key=f"filtro_{col}", placeholder="Parte do nome")
+    saldo = colunas[-1].checkbox("Só com saldo devedor")
+    c1, c2, c3, c4 = st.columns(4)
+    ordem = c1.selectbox("Ordenar por", [c for c in ORDENS if c in ds.data.columns], format_func=ORDENS.get)
+    decrescente = c2.toggle("Decrescente")
+    tamanho = c3.selectbox("Linhas por página", PAGE_SIZES)
+    editando = c4.toggle("Edição em massa")
+
+    with perf.span("filter"):
+        linhas = grid.rows(filtros, saldo, ordem, decrescente)
+    paginas = max(1, -(-len(linhas) // tamanho))
+    # Filtro ou ordem novos voltam para a primeira página
+    consulta = (repr(filtros), saldo, ordem, decrescente, tamanho)
+    if st.session_state.get('grid_consulta') != consulta or st.session_state.get('pagina', 1) > paginas:
+        st.session_state['grid_consulta'] = consulta
+        st.session_state['pagina'] = 1
+    pagina = st.number_input("Página", min_value=1, max_value=paginas, step=1, key='pagina')
+    st.caption(f"{len(linhas)} registro(s) · página {pagina} de {paginas}")
+    if editando:
+        bulk_editor(ds, grid, linhas, pagina, tamanho)
+        return
+    with perf.span("page"):
+        visiveis = grid.page(linhas, pagina, tamanho)
+    st.dataframe(visiveis, hide_index=True, column_config=GRID_CONFIG, width="stretch")
+    export_panel(ds, linhas)
+
+def export_panel(ds, linhas):
+    # Exporta o resultado do filtro inteiro (todas as páginas, na ordem da
+    # tabela). O arquivo só é gerado no clique, com todas as colunas (a
+    # página carrega só RECORD_COLUMNS), e fica guardado pela versão dos
+    # dados: o mesmo relatório baixado de novo sai pronto.
+    with st.expander("⬇️ Exportar"):
+        c1, c2 = st.columns([1, 2])
+        formato = c1.selectbox("Formato", list(EXPORT_FORMATS), format_func=str.upper)
+        filtro = st.session_state['grid_consulta'][:-1]  # sem o tamanho da página
+
+        def gerar():
+            # Projeção completa: lida uma vez por versão, como as demais
+            completo = dataset(storage, normalize=normalize)
+            chave = (storage.name, ds.version, completo.version, formato, filtro)
+            caminho = shared_exports().path(
+                chave, formato, export_data(completo.data), full_rows(completo.data, ds.data, linhas),
+            )
+            with open(caminho, "rb") as fh:
+                return fh.read()
+        c2.download_button(
+            f"Baixar {len(linhas)} registro(s)", gerar, on_click="ignore", mime=EXPORT_FORMATS[formato],
+            file_name=f"nacionalidade-{datetime.now():%Y%m%d}.{formato}",
+        )
+
+def bulk_editor(ds, grid, linhas, pagina, tamanho):
+    # Edição da página visível. O que foi alterado é conferido contra a
+    # página como estava ao abrir o editor (com a VERSAO de cada linha) e
+    # gravado num único lote, só com as células alteradas.
+    aviso = st.session_state.pop('lote_aviso', None)
+    if aviso:
+        st.warning(aviso)
+    consulta = (st.session_state['grid_consulta'], pagina)
+    lote = st.session_state.get('lote')
+    pendente = lote is not None and st.session_state.get(f"editor_{lote['n']}", {}).get('edited_rows')
+    if lote is None or lote['consulta'] != consulta or (lote['versao'] != ds.version and not pendente):
+        with perf.span("page"):
+            dados = grid.page(linhas, pagina, tamanho, extra=['VERSAO'])
+        n = st.session_state.get('lote_n', 0) + 1
+        lote = st.session_state['lote'] = {'consulta': consulta, 'versao': ds.version, 'dados': dados, 'n': n}
+        st.session_state['lote_n'] = n
+
+    dados = lote['dados']
+    editado = st.data_editor(
+        dados, key=f"editor_{lote['n']}", hide_index=True, width="stretch",
+        column_config={
+            **GRID_CONFIG,
+            'STATUS': st.column_config.SelectboxColumn("Status", options=STATUS_OPTIONS),
+            'ARTIGO': st.column_config.SelectboxColumn("Artigo", options=ARTIGO_OPTIONS),
+        },
+        column_order=[c for c in dados.columns if c != 'VERSAO'],
+        disabled=[c for c in dados.columns if c not in EDITABLE_COLUMNS],
+    )
+    with perf.span("diff"):
+        ops, erros = bulk_changes(dados, editado)
+    for record_id, erro in erros:
+        st.error(f"ID {record_id}: {erro}")
+    if st.button(f"Gravar alterações ({len(ops)} registro(s))", disabled=not ops or bool(erros), key="gravar_lote"):
+        try:
+            falhas = update_rows(storage, ops)
+        except ThrottledError:
+            st.error(AVISO_COTA)
+            return
+        if falhas:
+            st.session_state['lote_aviso'] = (
+                f"{len(ops) - len(falhas)} registro(s) gravado(s). Não gravados (alterados por outro"
+                f" usuário ou excluídos): {', '.join(str(ops[i]['id']) for i, _ in falhas)}. Confira e edite de novo."
+            )
+        else:
+            st.success(f"{len(ops)} registro(s) atualizado(s)!")
+        # Página recarregada com os dados novos
+        del st.session_state['lote']
+        st.rerun()
+
+@st.fragment
+@perf.measured("inclusão")
+def add_form():
     with st.form("form_add", clear_on_submit=True):
         c1, c2 = st.columns(2)
         with c1:
@@ -79,80 +280,261 @@ elif menu == "➕ Inclusão":
                 format="DD/MM/YYYY"
             )
         with c2:
-            art = st.selectbox("Artigo", ["Neto", "Filho", "Casamento", "Outros"])
-            sts = st.selectbox("Status", ["SUBMETIDO", "EM ANÁLISE", "DILIGÊNCIA", "DECISÃO", "CONCLUÍDO"])
+            art = st.selectbox("Artigo", ARTIGO_OPTIONS)
+            sts = st.selectbox("Status", STATUS_OPTIONS)
             hon = st.number_input("Honorários (R$)", min_value=0.0)
             pag = st.number_input("Valor Pago Inicial (R$)", min_value=0.0)
             
         obs = st.text_area("Observações")
         if st.form_submit_button("Salvar"):
             if req:
-                nova_linha = pd.DataFrame([{
-                    "ID": proximo_id, "REQUERENTE": req, "CLIENTE": cli, "E_MAIL": mail,
-                    "ANIVERSARIO": aniv.strftime('%d/%m/%Y'), "ARTIGO": art, "STATUS": sts,
-                    "VALOR_HONORARIOS": hon, "VALOR_PAGO": pag, "SALDO_DEVEDOR": hon - pag,
-                    "OBSERVACOES": obs
-                }])
-                df_novo = pd.concat([df, nova_linha], ignore_index=True)
-                conn.update(worksheet="NACIONALIDADE", data=df_novo)
-                st.success("Salvo com sucesso!")
-                st.cache_data.clear()
-                st.rerun()
+                try:
+                    with perf.span("write"):
+                        novo_id = storage.next_id()
+                    # Acrescenta só a nova linha no fim da aba
+                    append_row(storage, {
+                        "ID": novo_id, "REQUERENTE": req, "CLIENTE": cli, "E_MAIL": mail,
+                        "ANIVERSARIO": aniv.strftime('%d/%m/%Y'), "ARTIGO": art, "STATUS": sts,
+                        "VALOR_HONORARIOS": hon, "VALOR_PAGO": pag, "SALDO_DEVEDOR": hon - pag,
+                        "OBSERVACOES": obs
+                    })
+                except ThrottledError:
+                    # Mantém o formulário preenchido para tentar de novo
+                    st.error(AVISO_COTA)
+                    return
+                # O cache já recebeu a linha: as outras páginas a veem no próximo rerun
+                st.success(f"Salvo com sucesso! ID {novo_id}")
             else:
                 st.error("Nome obrigatório!")
 
-# --- GERENCIAR ---
-elif menu == "📝 Gerenciar Registros":
-    st.header("Editar ou Excluir")
-    if not df.empty:
-        nome_sel = st.selectbox("Selecione o Requerente", sorted(df['REQUERENTE'].unique()))
-        item = df[df['REQUERENTE'] == nome_sel].iloc[0]
-        
-        # Tenta converter a data da planilha, se falhar usa data atual
+@st.fragment
+@perf.measured("seletor")
+def record_picker(ds):
+    # Trocar de requerente reexecuta só este fragmento (seletor + formulário)
+    # Índices por ID/nome montados uma vez por versão dos dados
+    with perf.span("index"):
+        idx = ds.derived("index", RecordIndex.build)
+    if idx.missing_ids:
+        st.caption(f"{idx.missing_ids} registro(s) sem ID na planilha não aparecem na lista.")
+    conflito = st.session_state.get('conflito')
+    if conflito:
+        show_conflict(conflito)
+        return
+
+    if st.session_state.get('id_sel') not in (None, *idx.positions):
+        st.warning("O registro selecionado foi excluído por outro usuário.")
+        del st.session_state['id_sel']
+
+    # Só os resultados da busca vão para o navegador, não a lista inteira
+    busca = st.text_input("Pesquisar", placeholder="Nome, cliente, e-mail ou nº do processo")
+    if busca.strip():
+        with perf.span("search"):
+            opcoes = ds.derived("search", SearchIndex.build).search(busca)
+        if not opcoes:
+            st.info("Nenhum registro encontrado.")
+            return
+    else:
+        opcoes = idx.choices[:SEARCH_LIMIT]
+    if len(opcoes) == SEARCH_LIMIT:
+        st.caption(f"Mostrando {SEARCH_LIMIT} resultados; refine a busca para ver outros.")
+    if st.session_state.get('id_sel') not in (None, *opcoes):
+        del st.session_state['id_sel']
+    id_sel = st.selectbox("Selecione o Requerente", opcoes, format_func=idx.labels.get, key='id_sel')
+
+    # O formulário mostra o registro como estava quando foi aberto, e a
+    # gravação só acontece se ninguém o alterou desde então (VERSAO)
+    aberto = st.session_state.get('aberto')
+    if aberto is None or aberto['id'] != id_sel:
         try:
-            data_niver_atual = datetime.strptime(clean_val(item.get('ANIVERSARIO')), '%d/%m/%Y')
-            # Garante que a data atual do registro não quebre o componente se estiver fora do range
-            if data_niver_atual.year < 1900: data_niver_atual = datetime(1900, 1, 1)
-        except:
-            data_niver_atual = datetime.now()
-
-        with st.form("form_edit"):
-            c1, c2 = st.columns(2)
-            with c1:
-                ed_cli = st.text_input("Cliente", value=clean_val(item.get('CLIENTE')))
-                ed_mail = st.text_input("e-Mail", value=clean_val(item.get('E_MAIL')))
-                # Configuração de data para edição (1900 até HOJE)
-                ed_aniv = st.date_input(
-                    "Aniversário", 
-                    value=data_niver_atual, 
-                    min_value=datetime(1900, 1, 1), 
-                    max_value=datetime.now(), 
-                    format="DD/MM/YYYY"
-                )
-            with c2:
-                lista_status = ["SUBMETIDO", "EM ANÁLISE", "DILIGÊNCIA", "DECISÃO", "CONCLUÍDO"]
-                st_planilha = str(item.get('STATUS', 'SUBMETIDO')).strip().upper()
-                idx_st = lista_status.index(st_planilha) if st_planilha in lista_status else 0
-                ed_sts = st.selectbox("Status", lista_status, index=idx_st)
-                
-                ed_hon = st.number_input("Honorários", value=float(item.get('VALOR_HONORARIOS', 0)))
-                ed_pag = st.number_input("Pago", value=float(item.get('VALOR_PAGO', 0)))
-            
-            ed_obs = st.text_area("Observações", value=clean_val(item.get('OBSERVACOES')))
+            aberto = st.session_state['aberto'] = {'id': id_sel, 'item': open_record(ds, idx, id_sel)}
+        except ThrottledError:
+            st.error(AVISO_COTA)
+            return
+    edit_form(id_sel, aberto['item'])
+
+@st.fragment
+@perf.measured("edição")
+def edit_form(id_sel, item):
+    versao_lida = item.get('VERSAO')
+    
+    # Data já convertida na carga; vazia ou inválida usa a data atual
+    aniv = item.get('ANIVERSARIO')
+    data_niver_atual = datetime.now() if pd.isna(aniv) else aniv.to_pydatetime()
+    # Garante que a data atual do registro não quebre o componente se estiver fora do range
+    if data_niver_atual.year < 1900: data_niver_atual = datetime(1900, 1, 1)
+
+    with st.form(f"form_edit_{id_sel}"):
+        c1, c2 = st.columns(2)
+        with c1:
+            ed_cli = st.text_input("Cliente", value=clean_val(item.get('CLIENTE')))
+            ed_mail = st.text_input("e-Mail", value=clean_val(item.get('E_MAIL')))
+            # Configuração de data para edição (1900 até HOJE)
+            ed_aniv = st.date_input(
+                "Aniversário", 
+                value=data_niver_atual, 
+                min_value=datetime(1900, 1, 1), 
+                max_value=datetime.now(), 
+                format="DD/MM/YYYY"
+            )
+        with c2:
+            st_planilha = str(item.get('STATUS', 'SUBMETIDO')).strip().upper()
+            idx_st = STATUS_OPTIONS.index(st_planilha) if st_planilha in STATUS_OPTIONS else 0
+            ed_sts = st.selectbox("Status", STATUS_OPTIONS, index=idx_st)
             
-            col_b1, col_b2 = st.columns(2)
-            if col_b1.form_submit_button("Gravar"):
-                idx = df[df['REQUERENTE'] == nome_sel].index
-                df.loc[idx, ['CLIENTE', 'E_MAIL', 'ANIVERSARIO', 'STATUS', 'VALOR_HONORARIOS', 'VALOR_PAGO', 'SALDO_DEVEDOR', 'OBSERVACOES']] = \
-                    [ed_cli, ed_mail, ed_aniv.strftime('%d/%m/%Y'), ed_sts, ed_hon, ed_pag, ed_hon - ed_pag, ed_obs]
-                conn.update(worksheet="NACIONALIDADE", data=df)
+            # Valores guardados em centavos
+            ed_hon = st.number_input("Honorários", value=reais(item.get('VALOR_HONORARIOS')))
+            ed_pag = st.number_input("Pago", value=reais(item.get('VALOR_PAGO')))
+        
+        ed_obs = st.text_area("Observações", value=clean_val(item.get('OBSERVACOES')))
+        
+        col_b1, col_b2 = st.columns(2)
+        if col_b1.form_submit_button("Gravar"):
+            campos = {
+                'CLIENTE': ed_cli, 'E_MAIL': ed_mail, 'ANIVERSARIO': ed_aniv.strftime('%d/%m/%Y'),
+                'STATUS': ed_sts, 'VALOR_HONORARIOS': ed_hon, 'VALOR_PAGO': ed_pag,
+                'SALDO_DEVEDOR': ed_hon - ed_pag, 'OBSERVACOES': ed_obs
+            }
+            try:
+                # Regrava só as células do registro selecionado
+                update_row(storage, id_sel, campos, expected_version=versao_lida)
+                st.session_state.pop('aberto', None)
                 st.success("Atualizado!")
-                st.cache_data.clear()
-                st.rerun()
-            
-            if col_b2.form_submit_button("🗑️ Excluir", type="secondary"):
-                df_exc = df[df['REQUERENTE'] != nome_sel]
-                conn.update(worksheet="NACIONALIDADE", data=df_exc)
+            except ConflictError as e:
+                st.session_state['conflito'] = {'id': id_sel, 'meu': campos, 'atual': e.current}
+            except ThrottledError:
+                st.error(AVISO_COTA)
+                return
+            st.rerun()
+        
+        if col_b2.form_submit_button("🗑️ Excluir", type="secondary"):
+            try:
+                delete_row(storage, id_sel, expected_version=versao_lida)
+                st.session_state.pop('aberto', None)
                 st.warning("Excluído!")
-                st.cache_data.clear()
+            except ConflictError as e:
+                st.session_state['conflito'] = {'id': id_sel, 'meu': None, 'atual': e.current}
+            except ThrottledError:
+                st.error(AVISO_COTA)
+                return
+            st.rerun()
+
+@st.fragment
+@perf.measured("importação")
+def import_page():
+    arquivo = st.file_uploader("Arquivo CSV ou XLSX", type=["csv", "xlsx"])
+    st.caption(
+        "Cabeçalho com as colunas da aba (ao menos Requerente). Linhas já cadastradas "
+        "(mesmo nº do processo, ou mesmo requerente e cliente) são puladas."
+    )
+    if arquivo is None:
+        return
+    # Importação interrompida do mesmo arquivo continua do último bloco gravado
+    pasta = setting("import_dir", "importacoes")
+    estado = Checkpoint(pasta, file_digest(arquivo)).state
+    if estado['concluido']:
+        st.info(f"Este arquivo já foi importado ({estado['importados']} registro(s)).")
+        return
+    if estado['linha']:
+        st.info(f"A importação anterior deste arquivo parou na linha {estado['linha']}; continua dali.")
+    if not st.button("Importar"):
+        return
+
+    barra = st.progress(0.0, text="Lendo o arquivo...")
+    def progresso(fracao, estado):
+        barra.progress(fracao or 0.0, text=(
+            f"Linha {estado['linha']}: {estado['importados']} importado(s), "
+            f"{estado['duplicados']} duplicado(s), {estado['erros']} com erro"
+        ))
+    try:
+        with perf.span("import"):
+            importador = Importer(storage, load_data(RECORD_COLUMNS).data, pasta)
+            estado = importador.run(arquivo, arquivo.name, progresso)
+    except SchemaError as e:
+        st.error(str(e))
+        return
+    except UnicodeDecodeError:
+        st.error("Não foi possível ler o arquivo: salve o CSV como UTF-8 (no Excel, \"CSV UTF-8\") e importe de novo.")
+        return
+    except ThrottledError:
+        st.error(AVISO_COTA + " O que já foi gravado fica; importe o mesmo arquivo de novo para continuar.")
+        return
+    barra.progress(1.0, text="Concluído")
+    st.success(f"{estado['importados']} registro(s) importado(s); {estado['duplicados']} duplicado(s) pulado(s).")
+    if importador.errors:
+        st.warning(f"{estado['erros']} linha(s) com erro não foram importadas (até {MAX_ERRORS} listadas abaixo).")
+        st.dataframe(pd.DataFrame(importador.errors, columns=["Linha", "Problema"]), hide_index=True)
+
+def counters():
+    # Contadores do processo para o painel de desempenho
+    cache = shared_cache()
+    valores = {"leituras": cache.reads, "conferências": cache.probes, "dados antigos servidos": cache.stale}
+    api = storage.api_stats()
+    if api is not None:
+        valores.update({
+            "chamadas à API": api['requests'], "repetidas": api['retried'],
+            "sem cota": api['throttled'], "falhas": api['failed'],
+        })
+    return valores
+
+# --- MENU LATERAL ---
+st.sidebar.title("Nacionalidade App")
+menu = st.sidebar.radio(
+    "Navegação", ["📊 Dashboard", "📋 Registros", "➕ Inclusão", "📥 Importação", "📝 Gerenciar Registros"],
+)
+perf.tag(pagina=menu)
+perf.panel(counters())
+
+# Fila de gravações do modo write-behind (None quando desligado)
+fila = storage.queue_status()
+if fila is not None:
+    if fila['pending']:
+        st.sidebar.caption(f"⏳ {fila['pending']} gravação(ões) aguardando envio")
+    if fila['failed']:
+        with st.sidebar.expander(f"⚠️ {len(fila['failed'])} gravação(ões) recusada(s)"):
+            for seq, op, erro in fila['failed']:
+                st.write(f"{op['op']} ID {op.get('id', op.get('record', {}).get('ID'))}: {erro}")
+            if st.button("Dispensar avisos"):
+                storage.dismiss_failures()
                 st.rerun()
+
+# --- DASHBOARD ---
+if menu == "📊 Dashboard":
+    st.header("Resumo Geral")
+    ds = load_data(DASHBOARD_COLUMNS)
+    if not ds.data.empty:
+        # Agregados mantidos por versão dos dados (atualizados a cada gravação)
+        with perf.span("aggregate"):
+            agg = ds.derived("aggregates", Aggregates.build)
+        metrics(agg)
+        st.divider()
+        charts(agg)
+
+# --- REGISTROS ---
+elif menu == "📋 Registros":
+    st.header("Registros")
+    # Mesma projeção do Gerenciar: as duas páginas usam a mesma cópia em memória
+    ds = load_data(RECORD_COLUMNS)
+    if not ds.data.empty:
+        records_grid(ds)
+
+# --- INCLUSÃO ---
+elif menu == "➕ Inclusão":
+    st.header("Novo Cadastro")
+    
+    # O ID vem da sequência persistida no momento de salvar
+    st.write("ID do Registro: **gerado ao salvar**")
+    add_form()
+
+# --- IMPORTAÇÃO ---
+elif menu == "📥 Importação":
+    st.header("Importar Planilha")
+    import_page()
+
+# --- GERENCIAR ---
+elif menu == "📝 Gerenciar Registros":
+    st.header("Editar ou Excluir")
+    ds = load_data(RECORD_COLUMNS)
+    if not ds.data.empty:
+        record_picker(ds)
+
+perf.finish()
@@ -1,7 +1,7 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-import plotly.express as px
+from data_cache import read_sheet, invalidate_sheet
 
 st.set_page_config(page_title="Gestão de Nacionalidade", layout="wide")
 
@@ -9,8 +9,8 @@ st.set_page_config(page_title="Gestão de Nacionalidade", layout="wide")
 conn = st.connection("gsheets", type=GSheetsConnection)
 
 def load_data():
-    # ttl=0 garante que os dados não fiquem em cache e sejam sempre lidos do Google Sheets
-    return conn.read(worksheet="NACIONALIDADE", ttl="0")
+    # O cache do processo só relê a planilha quando ela muda de revisão
+    return read_sheet(conn)
 
 df = load_data()
 
@@ -20,6 +20,8 @@ menu = st.sidebar.radio("Navegação", ["📊 Dashboard", "➕ Novo Processo", "
 
 # --- DASHBOARD ---
 if menu == "📊 Dashboard":
+    # Plotly só é carregado por quem abre o Dashboard
+    import plotly.express as px
     st.header("Indicadores de Processos")
     
     col1, col2, col3, col4 = st.columns(4)
@@ -66,7 +68,7 @@ elif menu == "➕ Novo Processo":
             updated_df = pd.concat([df, new_row], ignore_index=True)
             conn.update(worksheet="NACIONALIDADE", data=updated_df)
             st.success("Processo cadastrado com sucesso!")
-            st.cache_data.clear()
+            invalidate_sheet()
 
 # --- ALTERAÇÃO / EXCLUSÃO ---
 elif menu == "📝 Gerenciar Registros":
@@ -102,6 +104,6 @@ elif menu == "📝 Gerenciar Registros":
                     df.loc[df[col_nome] == selecao, 'STATUS'] = novo_status
                     conn.update(worksheet="NACIONALIDADE", data=df)
                     st.success("Alteração salva com sucesso!")
-                    st.cache_data.clear() # Limpa o cache para atualizar o Dashboard
+                    invalidate_sheet() # Força nova leitura para atualizar o Dashboard
         else:
             st.error("Não encontramos dados para este Requerente. Tente atualizar a página.")
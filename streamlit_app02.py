@@ -1,8 +1,9 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-import plotly.express as px
 from datetime import datetime
+from data_cache import read_sheet, invalidate_sheet
+from schema import normalize_columns, promote_header
 
 # Configuração da Página
 st.set_page_config(page_title="Gestão Nacionalidade v2.0", layout="wide")
@@ -12,25 +13,14 @@ conn = st.connection("gsheets", type=GSheetsConnection)
 
 def load_data():
     # Lê a aba NACIONALIDADE
-    data = conn.read(worksheet="NACIONALIDADE", ttl="0")
+    data = read_sheet(conn)
     
     # LIMPEZA DE CABEÇALHO: Pula a linha de título se necessário e padroniza
     # Se a primeira linha for o título 'CONTROLE...', usamos a próxima como header
-    if "CONTROLE" in str(data.columns[1]):
-        data.columns = data.iloc[0]
-        data = data.iloc[1:].reset_index(drop=True)
+    data = promote_header(data)
 
     # PADRONIZAÇÃO DE COLUNAS: Maiúsculo, sem espaços extras, sem acentos e troca espaço por '_'
-    data.columns = [
-        str(c).strip().upper()
-        .replace(' ', '_')
-        .replace('É', 'E')
-        .replace('Á', 'A')
-        .replace('Ç', 'C')
-        .replace('Õ', 'O')
-        .replace('-', '_') 
-        for c in data.columns
-    ]
+    data.columns = normalize_columns(data.columns)
     
     # Remove linhas onde o Requerente está vazio
     if 'REQUERENTE' in data.columns:
@@ -47,6 +37,8 @@ menu = st.sidebar.radio("Navegação", ["📊 Dashboard", "➕ Inclusão", "📝
 
 # --- MODULO 1: DASHBOARD ---
 if menu == "📊 Dashboard":
+    # Plotly só é carregado por quem abre o Dashboard
+    import plotly.express as px
     st.header("Resumo dos Processos")
     
     if not df.empty:
@@ -129,7 +121,7 @@ elif menu == "➕ Inclusão":
                 conn.update(worksheet="NACIONALIDADE", data=df_updated)
                 
                 st.success(f"Processo de {requerente} salvo com sucesso!")
-                st.cache_data.clear()
+                invalidate_sheet()
             else:
                 st.error("O campo 'Requerente' é obrigatório.")
 
@@ -182,12 +174,12 @@ elif menu == "📝 Gerenciar Registros":
                     
                     conn.update(worksheet="NACIONALIDADE", data=df)
                     st.success("Alterações salvas!")
-                    st.cache_data.clear()
+                    invalidate_sheet()
                     st.rerun()
 
                 if col_btn2.button("🗑️ Excluir Registro", type="primary"):
                     df = df[df['REQUERENTE'] != selecionado]
                     conn.update(worksheet="NACIONALIDADE", data=df)
                     st.warning("Registro excluído!")
-                    st.cache_data.clear()
+                    invalidate_sheet()
                     st.rerun()
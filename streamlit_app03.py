@@ -1,8 +1,9 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-import plotly.express as px
 from datetime import datetime
+from data_cache import read_sheet, invalidate_sheet
+from schema import normalize_columns, promote_header
 
 # Configuração da Página
 st.set_page_config(page_title="Gestão Nacionalidade v3.0", layout="wide")
@@ -12,21 +13,13 @@ conn = st.connection("gsheets", type=GSheetsConnection)
 
 def load_data():
     # Lê a aba NACIONALIDADE
-    data = conn.read(worksheet="NACIONALIDADE", ttl="0")
+    data = read_sheet(conn)
     
     # PADRONIZAÇÃO DE CABEÇALHO (Pula linhas de título e limpa nomes)
-    if "CONTROLE" in str(data.columns[1]):
-        data.columns = data.iloc[0]
-        data = data.iloc[1:].reset_index(drop=True)
+    data = promote_header(data)
 
     # Limpeza profunda nos nomes das colunas para evitar KeyError
-    data.columns = [
-        str(c).strip().upper()
-        .replace(' ', '_')
-        .replace('É', 'E').replace('Á', 'A').replace('Ç', 'C').replace('Õ', 'O')
-        .replace('/', '_').replace('-', '_').replace('__', '_')
-        for c in data.columns
-    ]
+    data.columns = normalize_columns(data.columns)
     
     # Garante que o ID seja numérico para o cálculo sequencial
     if 'ID' in data.columns:
@@ -47,6 +40,8 @@ menu = st.sidebar.radio("Navegação", ["📊 Dashboard", "➕ Inclusão", "📝
 
 # --- MODULO 1: DASHBOARD ---
 if menu == "📊 Dashboard":
+    # Plotly só é carregado por quem abre o Dashboard
+    import plotly.express as px
     st.header("Painel de Indicadores")
     
     if not df.empty:
@@ -132,7 +127,7 @@ elif menu == "➕ Inclusão":
                 conn.update(worksheet="NACIONALIDADE", data=df_final)
                 
                 st.success(f"Registro {proximo_id} ({requerente}) adicionado com sucesso!")
-                st.cache_data.clear()
+                invalidate_sheet()
             else:
                 st.error("Por favor, preencha o nome do Requerente.")
 
@@ -186,12 +181,12 @@ elif menu == "📝 Gerenciar Registros":
                     
                     conn.update(worksheet="NACIONALIDADE", data=df)
                     st.success("Informações atualizadas!")
-                    st.cache_data.clear()
+                    invalidate_sheet()
                     st.rerun()
 
                 if col_btn2.button("🗑️ Excluir permanentemente", type="primary"):
                     df_novo = df[df['REQUERENTE'] != selecionado]
                     conn.update(worksheet="NACIONALIDADE", data=df_novo)
                     st.warning("O registro foi removido da planilha.")
-                    st.cache_data.clear()
+                    invalidate_sheet()
                     st.rerun()
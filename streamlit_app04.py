@@ -1,8 +1,9 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-import plotly.express as px
 from datetime import datetime
+from data_cache import read_sheet, invalidate_sheet
+from schema import normalize_columns, promote_header
 
 # Configuração da Página
 st.set_page_config(page_title="Gestão Nacionalidade v3.1", layout="wide")
@@ -11,20 +12,12 @@ st.set_page_config(page_title="Gestão Nacionalidade v3.1", layout="wide")
 conn = st.connection("gsheets", type=GSheetsConnection)
 
 def load_data():
-    data = conn.read(worksheet="NACIONALIDADE", ttl="0")
+    data = read_sheet(conn)
     
     # PADRONIZAÇÃO DE CABEÇALHO
-    if "CONTROLE" in str(data.columns[1]):
-        data.columns = data.iloc[0]
-        data = data.iloc[1:].reset_index(drop=True)
+    data = promote_header(data)
 
-    data.columns = [
-        str(c).strip().upper()
-        .replace(' ', '_')
-        .replace('É', 'E').replace('Á', 'A').replace('Ç', 'C').replace('Õ', 'O')
-        .replace('/', '_').replace('-', '_').replace('__', '_')
-        for c in data.columns
-    ]
+    data.columns = normalize_columns(data.columns)
     
     if 'ID' in data.columns:
         data['ID'] = pd.to_numeric(data['ID'], errors='coerce')
@@ -48,6 +41,8 @@ menu = st.sidebar.radio("Navegação", ["📊 Dashboard", "➕ Inclusão", "📝
 
 # --- MODULO 1: DASHBOARD ---
 if menu == "📊 Dashboard":
+    # Plotly só é carregado por quem abre o Dashboard
+    import plotly.express as px
     st.header("Painel de Indicadores")
     if not df.empty:
         col1, col2, col3, col4 = st.columns(4)
@@ -107,7 +102,7 @@ elif menu == "➕ Inclusão":
                 df_final = pd.concat([df, nova_linha], ignore_index=True)
                 conn.update(worksheet="NACIONALIDADE", data=df_final)
                 st.success(f"Registro {proximo_id} salvo!")
-                st.cache_data.clear()
+                invalidate_sheet()
             else:
                 st.error("O nome do Requerente é obrigatório.")
 
@@ -151,11 +146,11 @@ elif menu == "📝 Gerenciar Registros":
                     
                     conn.update(worksheet="NACIONALIDADE", data=df)
                     st.success("Atualizado!")
-                    st.cache_data.clear()
+                    invalidate_sheet()
                     st.rerun()
 
                 if st.button("🗑️ Excluir permanentemente", type="primary"):
                     df = df[df['REQUERENTE'] != selecionado]
                     conn.update(worksheet="NACIONALIDADE", data=df)
-                    st.cache_data.clear()
+                    invalidate_sheet()
                     st.rerun()
@@ -1,8 +1,9 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-import plotly.express as px
 from datetime import datetime
+from data_cache import read_sheet, invalidate_sheet
+from schema import normalize_columns
 
 # Configuração da Página
 st.set_page_config(page_title="Gestão Nacionalidade v3.2", layout="wide")
@@ -12,15 +13,10 @@ conn = st.connection("gsheets", type=GSheetsConnection)
 
 def load_data():
     # Lemos a planilha assumindo que a LINHA 1 é o cabeçalho
-    data = conn.read(worksheet="NACIONALIDADE", ttl="0")
+    data = read_sheet(conn)
     
     # PADRONIZAÇÃO DE COLUNAS (Transforma tudo em MAIÚSCULO e remove espaços)
-    data.columns = [
-        str(c).strip().upper()
-        .replace(' ', '_').replace('É', 'E').replace('Á', 'A')
-        .replace('Ç', 'C').replace('Õ', 'O').replace('/', '_')
-        for c in data.columns
-    ]
+    data.columns = normalize_columns(data.columns)
     
     # Converte ID para número e remove linhas totalmente vazias
     if 'ID' in data.columns:
@@ -50,6 +46,8 @@ menu = st.sidebar.radio("Navegação", ["📊 Dashboard", "➕ Inclusão", "📝
 
 # --- DASHBOARD ---
 if menu == "📊 Dashboard":
+    # Plotly só é carregado por quem abre o Dashboard
+    import plotly.express as px
     st.header("Resumo Geral")
     if not df.empty:
         c1, c2, c3, c4 = st.columns(4)
@@ -97,7 +95,7 @@ elif menu == "➕ Inclusão":
                 df_novo = pd.concat([df, nova_linha], ignore_index=True)
                 conn.update(worksheet="NACIONALIDADE", data=df_novo)
                 st.success("Salvo com sucesso!")
-                st.cache_data.clear()
+                invalidate_sheet()
             else:
                 st.error("Nome obrigatório!")
 
@@ -133,12 +131,12 @@ elif menu == "📝 Gerenciar Registros":
                     [ed_cli, ed_mail, ed_aniv, ed_sts, ed_hon, ed_pag, ed_hon - ed_pag, ed_obs]
                 conn.update(worksheet="NACIONALIDADE", data=df)
                 st.success("Atualizado!")
-                st.cache_data.clear()
+                invalidate_sheet()
                 st.rerun()
             
             if col_b2.form_submit_button("🗑️ Excluir", type="secondary"):
                 df_exc = df[df['REQUERENTE'] != nome_sel]
                 conn.update(worksheet="NACIONALIDADE", data=df_exc)
                 st.warning("Excluído!")
-                st.cache_data.clear()
+                invalidate_sheet()
                 st.rerun()
@@ -1,8 +1,9 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-import plotly.express as px
 from datetime import datetime
+from data_cache import read_sheet, invalidate_sheet
+from schema import normalize_columns
 
 # Configuração da Página
 st.set_page_config(page_title="Gestão Nacionalidade v3.3", layout="wide")
@@ -11,15 +12,10 @@ st.set_page_config(page_title="Gestão Nacionalidade v3.3", layout="wide")
 conn = st.connection("gsheets", type=GSheetsConnection)
 
 def load_data():
-    data = conn.read(worksheet="NACIONALIDADE", ttl="0")
+    data = read_sheet(conn)
     
     # PADRONIZAÇÃO DE COLUNAS
-    data.columns = [
-        str(c).strip().upper()
-        .replace(' ', '_').replace('É', 'E').replace('Á', 'A')
-        .replace('Ç', 'C').replace('Õ', 'O').replace('/', '_')
-        for c in data.columns
-    ]
+    data.columns = normalize_columns(data.columns)
     
     if 'ID' in data.columns:
         data['ID'] = pd.to_numeric(data['ID'], errors='coerce')
@@ -46,6 +42,8 @@ menu = st.sidebar.radio("Navegação", ["📊 Dashboard", "➕ Inclusão", "📝
 
 # --- DASHBOARD ---
 if menu == "📊 Dashboard":
+    # Plotly só é carregado por quem abre o Dashboard
+    import plotly.express as px
     st.header("Resumo Geral")
     if not df.empty:
         c1, c2, c3, c4 = st.columns(4)
@@ -91,7 +89,7 @@ elif menu == "➕ Inclusão":
                 df_novo = pd.concat([df, nova_linha], ignore_index=True)
                 conn.update(worksheet="NACIONALIDADE", data=df_novo)
                 st.success("Salvo com sucesso!")
-                st.cache_data.clear()
+                invalidate_sheet()
                 st.rerun()
             else:
                 st.error("Nome obrigatório!")
@@ -134,12 +132,12 @@ elif menu == "📝 Gerenciar Registros":
                     [ed_cli, ed_mail, ed_aniv.strftime('%d/%m/%Y'), ed_sts, ed_hon, ed_pag, ed_hon - ed_pag, ed_obs]
                 conn.update(worksheet="NACIONALIDADE", data=df)
                 st.success("Atualizado!")
-                st.cache_data.clear()
+                invalidate_sheet()
                 st.rerun()
             
             if col_b2.form_submit_button("🗑️ Excluir", type="secondary"):
                 df_exc = df[df['REQUERENTE'] != nome_sel]
                 conn.update(worksheet="NACIONALIDADE", data=df_exc)
                 st.warning("Excluído!")
-                st.cache_data.clear()
+                invalidate_sheet()
                 st.rerun()
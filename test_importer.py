@@ -0,0 +1,21 @@
+import io
+
+from importer import csv_chunks
+
+# Leitura de CSV nas codificações em que o escritório recebe os arquivos.
+#
+#   python -m pytest test_importer.py
+
+
+def _rows(data):
+    return [row for chunk, _ in csv_chunks(io.BytesIO(data)) for row in chunk.to_dict("records")]
+
+
+def test_csv_from_excel_in_cp1252():
+    data = "Requerente;Cliente\nJosé Gonçalves;Célia\n".encode("cp1252")
+    assert _rows(data) == [{'Requerente': 'José Gonçalves', 'Cliente': 'Célia'}]
+
+
+def test_csv_in_utf8_with_bom():
+    data = "Requerente,Cliente\nJosé Gonçalves,Célia\n".encode("utf-8-sig")
+    assert _rows(data) == [{'Requerente': 'José Gonçalves', 'Cliente': 'Célia'}]
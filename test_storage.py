@@ -0,0 +1,53 @@
+from fake_gsheets import FakeConnection, synthetic_sheet
+from sheets_client import SheetsClient
+from storage import SheetsStorage
+
+# SheetsStorage contra a planilha falsa quando alguém mexe nas colunas da
+# aba com o app aberto (o cabeçalho fica guardado no processo).
+#
+#   python -m pytest test_storage.py
+
+
+def _storage():
+    conn = FakeConnection(synthetic_sheet(20))
+    return conn, SheetsStorage(conn, client=SheetsClient(sleep=lambda s: None))
+
+
+def _insert_column(conn, position, title):
+    # Como inserir uma coluna pela interface do Sheets
+    ws = conn.spreadsheet.worksheet("NACIONALIDADE")
+    for i, row in enumerate(ws.values):
+        row.insert(position, title if i == 0 else "")
+    ws._touch()
+    return ws
+
+
+def test_update_follows_inserted_column():
+    conn, storage = _storage()
+    storage.read(['ID', 'STATUS'])
+    ws = _insert_column(conn, 2, 'Telefone')
+    storage.revision()
+    storage.update_row(1, {'STATUS': 'CONCLUÍDO'})
+    header = ws.values[0]
+    assert ws.values[1][header.index('Status')] == 'CONCLUÍDO'
+    assert ws.values[1][header.index('Telefone')] == ''
+
+
+def test_projection_follows_inserted_column():
+    conn, storage = _storage()
+    before = storage.read(['ID', 'STATUS'])
+    _insert_column(conn, 0, 'Telefone')
+    after = storage.read(['ID', 'STATUS'])
+    assert after.equals(before)
+
+
+def test_append_follows_inserted_column():
+    conn, storage = _storage()
+    storage.read(['ID'])
+    storage.revision()
+    ws = _insert_column(conn, 1, 'Telefone')
+    storage.revision()
+    storage.append_row({'ID': 100, 'REQUERENTE': 'Célia Araújo'})
+    header = ws.values[0]
+    assert ws.values[-1][header.index('ID')] == '100'
+    assert ws.values[-1][header.index('Requerente')] == 'Célia Araújo'
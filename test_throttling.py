@@ -0,0 +1,47 @@
+import pytest
+
+from data_cache import SheetCache
+from fake_gsheets import FakeConnection, synthetic_sheet
+from schema import normalize
+from sheets_client import SheetsClient, ThrottledError
+from storage import SheetsStorage
+
+# Cota do Google simulada pelo FakeSpreadsheet (fail_next: as próximas N
+# chamadas recebem 429). O cliente recebe um sleep que só anota as esperas.
+#
+#   python -m pytest test_throttling.py
+
+
+def _storage(max_retries=5):
+    conn = FakeConnection(synthetic_sheet(20))
+    sleeps = []
+    client = SheetsClient(max_retries=max_retries, sleep=sleeps.append)
+    return conn, SheetsStorage(conn, client=client), sleeps
+
+
+def test_retries_until_quota_returns():
+    conn, storage, sleeps = _storage()
+    conn.spreadsheet.fail_next = 3
+    assert storage.revision() is not None
+    assert storage.client.stats()['retried'] == 3
+    assert len(sleeps) == 3
+
+
+def test_cached_dataset_served_when_throttled():
+    conn, storage, sleeps = _storage(max_retries=2)
+    cache = SheetCache()
+    entry = cache.get(storage, normalize)
+    conn.spreadsheet.fail_next = 3
+    assert cache.get(storage, normalize) is entry
+    assert cache.stale == 1
+    # Com cópia para servir, nada de esperar pela cota
+    assert sleeps == []
+    assert storage.client.stats()['throttled'] == 1
+
+
+def test_cold_load_throttled_raises():
+    conn, storage, sleeps = _storage(max_retries=2)
+    conn.spreadsheet.fail_next = 10
+    with pytest.raises(ThrottledError):
+        SheetCache().get(storage, normalize)
+    assert len(sleeps) == 2
@@ -0,0 +1,64 @@
+import pytest
+from gspread.exceptions import APIError
+
+from fake_gsheets import FakeConnection, synthetic_sheet
+from sheets_client import SheetsClient
+from storage import SheetsStorage, _version
+from write_behind import WriteBehindStorage
+
+# Envio do write-behind que falha no meio (503 numa das requisições do lote,
+# via FakeSpreadsheet.errors) e é repetido no ciclo seguinte: nada pode ser
+# gravado duas vezes nem aparecer como recusado.
+#
+#   python -m pytest test_write_behind.py
+
+
+def _storage(tmp_path):
+    conn = FakeConnection(synthetic_sheet(20))
+    inner = SheetsStorage(conn, client=SheetsClient(max_retries=0, sleep=lambda s: None))
+    # Intervalo longo: só os flush() do teste enviam
+    return conn, inner, WriteBehindStorage(inner, str(tmp_path / "journal.db"), interval=3600)
+
+
+def _ids(conn):
+    ws = conn.spreadsheet.worksheet("NACIONALIDADE")
+    return [row[0] for row in ws.values[1:]]
+
+
+def _version_of(inner, record_id):
+    return _version(inner.read_record(record_id, ['VERSAO'])['VERSAO'])
+
+
+def test_append_not_repeated_after_partial_flush(tmp_path):
+    conn, inner, storage = _storage(tmp_path)
+    version = _version_of(inner, 1)
+    storage.append_row({'ID': 100, 'REQUERENTE': 'Célia Araújo'})
+    storage.update_row(1, {'STATUS': 'CONCLUÍDO'}, expected_version=version)
+    # O append passa; a leitura das linhas a conferir recebe 503
+    conn.spreadsheet.errors = {'batch_get': [503]}
+    with pytest.raises(APIError):
+        storage.flush()
+    assert storage.queue_status()['pending'] == 2
+
+    storage.flush()
+    assert _ids(conn).count('100') == 1
+    assert _version_of(inner, 1) == version + 1
+    assert storage.queue_status() == {'pending': 0, 'failed': []}
+
+
+def test_update_not_refused_after_delete_batch_fails(tmp_path):
+    conn, inner, storage = _storage(tmp_path)
+    version = _version_of(inner, 1)
+    storage.update_row(1, {'STATUS': 'CONCLUÍDO'}, expected_version=version)
+    storage.update_row(1, {'ARTIGO': 'Neto'}, expected_version=version + 1)
+    storage.delete_row(2, expected_version=_version_of(inner, 2))
+    # As células são gravadas; a exclusão (segundo batch_update) recebe 503
+    conn.spreadsheet.errors = {'batch_update': [None, 503]}
+    with pytest.raises(APIError):
+        storage.flush()
+
+    storage.flush()
+    assert storage.queue_status() == {'pending': 0, 'failed': []}
+    assert _version_of(inner, 1) == version + 2
+    assert inner.read_record(1, ['STATUS', 'ARTIGO']) == {'STATUS': 'CONCLUÍDO', 'ARTIGO': 'Neto'}
+    assert '2' not in _ids(conn)
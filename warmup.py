@@ -0,0 +1,64 @@
+import importlib
+import logging
+import threading
+import time
+
+import streamlit as st
+
+from aggregates import Aggregates
+from data_cache import shared_cache
+from grid import RecordGrid
+from indexes import RecordIndex, SearchIndex
+from schema import DASHBOARD_COLUMNS, RECORD_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Módulos pesados que só algumas páginas usam
+MODULES = ["plotly.express"]
+
+
+class Warmup:
+    # Aquecimento do processo em segundo plano: carrega os dados no cache
+    # compartilhado, monta os índices/agregados e importa os módulos
+    # pesados, para que a primeira visita a cada página já encontre tudo
+    # pronto. Roda uma vez por processo (na primeira sessão que abre o app).
+
+    def __init__(self, storage, normalize):
+        self.timings = {}  # etapa -> segundos
+        self.done = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(shared_cache(), storage, normalize), name="warmup", daemon=True,
+        )
+        self._thread.start()
+
+    def _step(self, name, fn):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            # Aquecer é só otimização: a página faz o trabalho se precisar
+            logger.exception("Falha no aquecimento (%s)", name)
+        self.timings[name] = time.perf_counter() - start
+
+    def _run(self, cache, storage, normalize):
+        # Cada página tem a sua projeção das colunas (ver schema)
+        state = {}
+        self._step("dados", lambda: state.update(
+            painel=cache.get(storage, normalize, DASHBOARD_COLUMNS),
+            registros=cache.get(storage, normalize, RECORD_COLUMNS),
+        ))
+        if "registros" in state:
+            # Gerenciar é a página mais cara na primeira visita
+            self._step("índice", lambda: state["registros"].derived("index", RecordIndex.build))
+            self._step("busca", lambda: state["registros"].derived("search", SearchIndex.build))
+            self._step("grade", lambda: state["registros"].derived("grid", RecordGrid.build))
+            self._step("agregados", lambda: state["painel"].derived("aggregates", Aggregates.build))
+        for module in MODULES:
+            self._step(module, lambda: importlib.import_module(module))
+        self.done.set()
+
+
+@st.cache_resource
+def start(_storage, name, _normalize):
+    # name entra na chave do cache: um aquecimento por backend
+    return Warmup(_storage, _normalize)
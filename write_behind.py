@@ -0,0 +1,280 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from schema import COLUMNS
+from storage import ConflictError, Storage, _same_id, _version
+
+logger = logging.getLogger(__name__)
+
+
+def _plain(val):
+    # Tipos numpy/pandas -> tipos nativos para o JSON do diário
+    if hasattr(val, "item"):
+        return val.item()
+    return str(val)
+
+
+def _chained(prev, op):
+    # op parte do resultado de prev (o mesmo usuário gravando de novo)? Só
+    # aí as duas podem virar uma: com a mesma versão esperada são edições
+    # concorrentes, e a segunda tem de chegar ao backend para ser recusada.
+    if op.get('expected_version') is None:
+        return prev['_version'] is None
+    return prev['_version'] is not None and _version(op['expected_version']) == prev['_version']
+
+
+def _after(op):
+    # VERSAO do registro depois da operação (None = sem controle de versão)
+    if op['op'] == 'append':
+        return 1
+    expected = op.get('expected_version')
+    return None if expected is None else _version(expected) + 1
+
+
+def coalesce(ops):
+    # Junta as operações pendentes antes de mandar ao backend, quando cada
+    # uma continua a anterior do mesmo ID (ver _chained):
+    # - updates seguidos viram um só (vale a versão esperada do primeiro);
+    # - updates de um registro incluído no mesmo lote entram no próprio append;
+    # - incluir e excluir no mesmo lote se anulam;
+    # - excluir descarta os updates anteriores.
+    # As demais vão separadas, na ordem. Quem junta N gravações leva
+    # bump = N: o backend soma N à VERSAO, como se tivessem ido uma a uma,
+    # e a versão gravada bate com a que a memória já mostra.
+    out = []
+    last = {}  # ID -> posição em out da última operação daquele ID
+    for op in ops:
+        record_id = op['record'].get('ID') if op['op'] == 'append' else op['id']
+        pos = last.get(record_id)
+        prev = out[pos] if pos is not None else None
+        seqs = op.get('_seqs', [])
+
+        if prev is None or not _chained(prev, op):
+            last[record_id] = len(out)
+            out.append({**op, '_version': _after(op)})
+            if op['op'] == 'append':
+                out[-1]['record'] = dict(op['record'])
+        elif op['op'] == 'update' and prev['op'] == 'append':
+            prev['record'].update(op['fields'])
+            prev['_seqs'] = prev['_seqs'] + seqs
+            prev['_version'] += 1
+            prev['bump'] = prev.get('bump', 1) + 1
+        elif op['op'] == 'update' and prev['op'] == 'update':
+            prev['fields'] = {**prev['fields'], **op['fields']}
+            prev['_seqs'] = prev['_seqs'] + seqs
+            prev['_version'] = _after(op)
+            prev['bump'] = prev.get('bump', 1) + 1
+        elif op['op'] == 'delete' and prev['op'] == 'append':
+            # Nunca chegou ao backend: basta não enviar
+            prev['op'] = 'noop'
+            prev['_seqs'] = prev['_seqs'] + seqs
+            del last[record_id]
+        elif op['op'] == 'delete' and prev['op'] == 'update':
+            out[pos] = {**op, 'expected_version': prev.get('expected_version'), '_seqs': prev['_seqs'] + seqs,
+                        '_version': None}
+        else:
+            last[record_id] = len(out)
+            out.append({**op, '_version': _after(op)})
+    return out
+
+
+class WriteBehindStorage(Storage):
+    # Modo write-behind: as gravações vão para um diário local (SQLite) e
+    # voltam na hora; uma thread junta as pendências e envia ao backend em
+    # lote a cada poucos segundos. Leituras e IDs continuam indo direto ao
+    # backend.
+
+    def __init__(self, inner, journal_path, interval=2.0):
+        self.name = inner.name
+        self.inner = inner
+        self.interval = interval
+        self.on_flush = None  # registrado pelo cache: on_flush(storage, ok, revisão antes do envio)
+        self.known_version = None  # registrado pelo cache: known_version(storage, ID) -> VERSAO em memória
+        self.flushes = 0
+        self.sent_ops = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # conferência + diário de cada gravação
+        self._db = sqlite3.connect(journal_path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " op TEXT, status TEXT DEFAULT 'pending', error TEXT, created REAL)"
+            )
+        self._wake = threading.Event()
+        # Pendências de uma execução anterior saem no primeiro ciclo
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def _journal(self, op):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO journal (op, created) VALUES (?, ?)",
+                [json.dumps(op, default=_plain), time.time()],
+            )
+
+    def revision(self):
+        return self.inner.revision()
+
+    def no_wait(self):
+        return self.inner.no_wait()
+
+    def api_stats(self):
+        return self.inner.api_stats()
+
+    def read(self, columns=None):
+        return self.inner.read(columns)
+
+    def read_record(self, record_id, columns):
+        # Valor no backend com as pendências deste registro por cima
+        try:
+            current = self.inner.read_record(record_id, columns)
+        except KeyError:
+            current = None
+        for op in self.pending():
+            if op['op'] == 'append' and _same_id(op['record'].get('ID'), record_id):
+                current = {c: op['record'].get(c) for c in columns}
+            elif op['op'] == 'update' and _same_id(op['id'], record_id) and current is not None:
+                current.update({c: v for c, v in op['fields'].items() if c in columns})
+            elif op['op'] == 'delete' and _same_id(op['id'], record_id):
+                current = None
+        if current is None:
+            raise KeyError(f"Registro ID {record_id} não encontrado")
+        return current
+
+    def _pending_version(self, record_id):
+        # VERSAO que o registro terá quando as pendências dele chegarem ao
+        # backend: (versão ou None se não há pendência com versão, excluído).
+        # Pendência que não confere com a anterior será recusada; não conta.
+        version, deleted = None, False
+        for op in self.pending():
+            if op['op'] == 'append':
+                if _same_id(op['record'].get('ID'), record_id):
+                    version, deleted = 1, False
+                continue
+            if not _same_id(op['id'], record_id):
+                continue
+            expected = op.get('expected_version')
+            if expected is not None and version is not None and _version(expected) != version:
+                continue
+            if op['op'] == 'delete':
+                deleted = True
+            elif expected is not None:
+                version = _version(expected) + 1
+            elif version is not None:
+                version += 1
+        return version, deleted
+
+    def _check(self, record_id, expected_version):
+        # Conflito sobe já na gravação, como nos outros backends: contra as
+        # pendências do diário e, sem elas, contra a versão em memória
+        if expected_version is None:
+            return
+        version, deleted = self._pending_version(record_id)
+        if deleted:
+            raise ConflictError(record_id, None)
+        if version is None and self.known_version is not None:
+            version = self.known_version(self, record_id)
+        if version is not None and version != _version(expected_version):
+            try:
+                current = self.read_record(record_id, COLUMNS)
+            except KeyError:
+                raise ConflictError(record_id, None)
+            raise ConflictError(record_id, {**current, 'VERSAO': version})
+
+    def next_id(self):
+        return self.inner.next_id()
+
+    def next_ids(self, count):
+        return self.inner.next_ids(count)
+
+    def append_row(self, record):
+        self._journal({'op': 'append', 'record': record})
+
+    def update_row(self, record_id, fields, expected_version=None):
+        with self._write_lock:
+            self._check(record_id, expected_version)
+            self._journal({'op': 'update', 'id': record_id, 'fields': fields, 'expected_version': expected_version})
+        # Versão que o registro terá quando o lote for gravado
+        return None if expected_version is None else int(expected_version) + 1
+
+    def delete_row(self, record_id, expected_version=None):
+        with self._write_lock:
+            self._check(record_id, expected_version)
+            self._journal({'op': 'delete', 'id': record_id, 'expected_version': expected_version})
+
+    def apply_batch(self, ops):
+        # Lote vindo do app (edição em massa / importação): cada operação é
+        # conferida como em update_row e as aceitas entram no diário de uma vez
+        failures, accepted = [], []
+        with self._write_lock:
+            for i, op in enumerate(ops):
+                try:
+                    if op['op'] in ('update', 'delete'):
+                        self._check(op['id'], op.get('expected_version'))
+                    accepted.append(op)
+                except ConflictError as e:
+                    failures.append((i, e))
+            now = time.time()
+            with self._lock, self._db:
+                self._db.executemany(
+                    "INSERT INTO journal (op, created) VALUES (?, ?)",
+                    [(json.dumps(op, default=_plain), now) for op in accepted],
+                )
+        return failures
+
+    def pending(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, op FROM journal WHERE status = 'pending' ORDER BY seq"
+            ).fetchall()
+        return [{**json.loads(op), '_seqs': [seq]} for seq, op in rows]
+
+    def queue_status(self):
+        with self._lock:
+            pending = self._db.execute("SELECT COUNT(*) FROM journal WHERE status = 'pending'").fetchone()[0]
+            failed = self._db.execute(
+                "SELECT seq, op, error FROM journal WHERE status = 'failed' ORDER BY seq"
+            ).fetchall()
+        return {'pending': pending, 'failed': [(seq, json.loads(op), error) for seq, op, error in failed]}
+
+    def dismiss_failures(self):
+        with self._lock, self._db:
+            self._db.execute("UPDATE journal SET status = 'dismissed' WHERE status = 'failed'")
+
+    def flush(self):
+        with self._flush_lock:
+            ops = self.pending()
+            if not ops:
+                return
+            batch = [op for op in coalesce(ops) if op['op'] != 'noop']
+            before = self.inner.revision()
+            failures = self.inner.apply_batch([{k: v for k, v in op.items() if not k.startswith('_')} for op in batch]) if batch else []
+            failed = {}
+            for index, error in failures:
+                for seq in batch[index]['_seqs']:
+                    failed[seq] = str(error)
+            with self._lock, self._db:
+                for op in ops:
+                    seq = op['_seqs'][0]
+                    if seq in failed:
+                        self._db.execute("UPDATE journal SET status = 'failed', error = ? WHERE seq = ?", [failed[seq], seq])
+                    else:
+                        self._db.execute("UPDATE journal SET status = 'done' WHERE seq = ?", [seq])
+            self.flushes += 1
+            self.sent_ops += len(batch)
+        if self.on_flush is not None:
+            self.on_flush(self, not failed, before)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Backend fora do ar / cota: as operações continuam pendentes
+                logger.exception("Falha ao enviar gravações pendentes; nova tentativa no próximo ciclo")